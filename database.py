@@ -36,6 +36,10 @@ COMMENTS_FILE = os.path.join(DATA_DIR, "comments.json")
 CSMS_PB_FILE = os.path.join(DATA_DIR, "csms_pb.json")
 RELATED_DOCS_FILE = os.path.join(DATA_DIR, "related_docs.json")
 
+# Column projections for callers that only need a few fields of a wide row
+TASK_STATUS_COLUMNS = "id,project_id,status"
+COMMENT_LIKE_COLUMNS = "id,likes"
+
 
 class Database:
     """
@@ -80,6 +84,13 @@ class Database:
             return supabase_service.get_projects()
         return self._read_json(PROJECTS_FILE)
 
+    def get_projects_needing_reminder(self, start: str, end: str) -> List[Dict]:
+        """Projects with a PIC email whose rig down falls in [start, end] (ISO dates)"""
+        if SUPABASE_ENABLED:
+            return supabase_service.get_projects_needing_reminder(start, end)
+        return [p for p in self._read_json(PROJECTS_FILE)
+                if p.get('pic_email') and p.get('rig_down') and start <= p['rig_down'][:10] <= end]
+
     def get_project(self, project_id: str) -> Optional[Dict]:
         """Get single project by ID"""
         if SUPABASE_ENABLED:
@@ -137,12 +148,28 @@ class Database:
 
     # ==================== TASKS ====================
     
-    def get_tasks(self, project_id: str = None) -> List[Dict]:
-        """Get all tasks from Supabase (or local fallback)"""
+    def get_task_statuses(self, project_ids: List[str]) -> List[Dict]:
+        """Tasks of the given projects (only project_id, code, title, status are guaranteed)"""
+        if SUPABASE_ENABLED:
+            return supabase_service.get_task_statuses(project_ids)
+        wanted = set(project_ids)
+        return [t for t in self._read_json(TASKS_FILE) if t.get('project_id') in wanted]
+
+    def get_task(self, task_id: str) -> Optional[Dict]:
+        """Get single task by ID"""
+        if SUPABASE_ENABLED:
+            return supabase_service.get_task(task_id)
+        return next((t for t in self._read_json(TASKS_FILE) if t['id'] == task_id), None)
+
+    def get_tasks(self, project_id: str = None, columns: str = "*",
+                  limit: Optional[int] = None, offset: int = 0, status: str = None) -> List[Dict]:
+        """Get tasks from Supabase (or local fallback); columns narrows the Supabase select, limit/offset page it"""
         if SUPABASE_ENABLED:
-            return supabase_service.get_tasks(project_id)
+            return supabase_service.get_tasks(project_id, columns, limit, offset, status)
         tasks = self._read_json(TASKS_FILE)
-        return [t for t in tasks if t.get('project_id') == project_id] if project_id else tasks
+        tasks = [t for t in tasks if t.get('project_id') == project_id] if project_id else tasks
+        tasks = [t for t in tasks if t.get('status') == status] if status else tasks
+        return tasks[offset:offset + limit] if limit is not None else tasks
 
     def create_task(self, task_data: Dict) -> Dict:
         """Create task - SYNCHRONOUS write to Supabase"""
@@ -249,10 +276,14 @@ def save_schedules(schedules: List[Dict]):
     with open(SCHEDULES_FILE, 'w') as f:
         json.dump(schedules, f, indent=2)
 
-def get_comments() -> List[Dict]:
+def get_comments(columns: str = "*", limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
     if SUPABASE_ENABLED:
-        return supabase_service.get_comments()
-    return json.load(open(COMMENTS_FILE)) if os.path.exists(COMMENTS_FILE) else []
+        return supabase_service.get_comments(columns, limit, offset)
+    comments = json.load(open(COMMENTS_FILE)) if os.path.exists(COMMENTS_FILE) else []
+    if limit is not None:
+        comments.sort(key=lambda x: x.get('created_at', ''), reverse=True)
+        comments = comments[offset:offset + limit]
+    return comments
 
 def save_comment(comment: Dict):
     """Save single comment - SYNCHRONOUS"""
@@ -305,11 +336,14 @@ def update_csms_pb(pb_id: str, updates: Dict):
     if SUPABASE_ENABLED:
         return supabase_service.update_csms_pb(pb_id, updates)
     records = get_csms_pb_records()
+    updated = None
     for r in records:
         if r.get('id') == pb_id:
             r.update(updates)
+            updated = r
     with open(CSMS_PB_FILE, 'w') as f:
         json.dump(records, f, indent=2)
+    return updated
 
 def delete_csms_pb(pb_id: str):
     """Delete CSMS PB - SYNCHRONOUS"""
@@ -6,8 +6,9 @@ load_dotenv()
 import sys
 sys.setrecursionlimit(2000)
 
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, BackgroundTasks
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, BackgroundTasks, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse, HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
@@ -17,17 +18,27 @@ import shutil
 import json
 import io
 import requests  # For Brevo API
-from datetime import datetime
+import logging
+import threading
+from datetime import datetime, date, timedelta
 from pathlib import Path
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import Counter
+
+try:
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+    SCHEDULER_AVAILABLE = True
+except ImportError:
+    SCHEDULER_AVAILABLE = False
 
 from services.google_drive import GoogleDriveService
 from config import STANDARD_TASKS
 from database import (
     Database, TASKS_FILE, PROJECTS_FILE, SCHEDULES_FILE, COMMENTS_FILE, CSMS_PB_FILE, RELATED_DOCS_FILE,
+    TASK_STATUS_COLUMNS, COMMENT_LIKE_COLUMNS,
     get_schedules, save_schedules, save_schedule, delete_schedule,
     get_comments, save_comments, save_comment, update_comment, delete_comment,
-    get_csms_pb_records, save_csms_pb_records, save_csms_pb, update_csms_pb, delete_csms_pb,
+    get_csms_pb_records, save_csms_pb, update_csms_pb, delete_csms_pb,
     get_related_docs, save_related_docs, save_related_doc, delete_related_doc
 )
 # Import Supabase service for direct operations
@@ -49,6 +60,9 @@ from services.scoring_service import ScoringService
 app = FastAPI()
 
 # --- Logging Setup ---
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'))
+logger = logging.getLogger(__name__)
+
 APP_LOGS = []
 MAX_APP_LOGS = 100
 
@@ -89,6 +103,14 @@ db = Database()
 drive_service = GoogleDriveService()
 scoring_service = ScoringService(db)
 
+# Independent reads (each a blocking Supabase round trip) are fanned out on this pool
+db_read_executor = ThreadPoolExecutor(max_workers=6, thread_name_prefix="db-read")
+
+def fetch_parallel(*calls):
+    """Run independent zero-argument read calls concurrently, returning their results in order"""
+    futures = [db_read_executor.submit(call) for call in calls]
+    return [future.result() for future in futures]
+
 # Mount static files for assets (logo, etc.)
 static_dir = Path(__file__).parent / "static"
 if static_dir.exists():
@@ -233,8 +255,8 @@ def force_sync_from_supabase():
         
         results = {"projects": 0, "tasks": 0, "message": ""}
         
-        # Force sync projects
-        cloud_projects = supabase_service.get_projects()
+        # Fetch both tables at once, then force sync projects
+        cloud_projects, cloud_tasks = fetch_parallel(supabase_service.get_projects, supabase_service.get_tasks)
         if cloud_projects:
             with open(PROJECTS_FILE, 'w') as f:
                 json.dump(cloud_projects, f, indent=2)
@@ -242,7 +264,6 @@ def force_sync_from_supabase():
             print(f"[FORCE SYNC] Restored {len(cloud_projects)} projects from Supabase")
         
         # Force sync tasks
-        cloud_tasks = supabase_service.get_tasks()
         if cloud_tasks:
             with open(TASKS_FILE, 'w') as f:
                 json.dump(cloud_tasks, f, indent=2)
@@ -283,8 +304,7 @@ def send_reminders(background_tasks: BackgroundTasks):
     import requests
     from datetime import datetime, timedelta
     
-    projects = db.get_projects()
-    tasks = db.get_tasks()
+    projects, tasks = fetch_parallel(db.get_projects, lambda: db.get_tasks(columns=TASK_STATUS_COLUMNS))
     sent_count = 0
     reminders_info = []
     
@@ -328,7 +348,7 @@ def send_reminders(background_tasks: BackgroundTasks):
                 print(f"[REMINDER] Project {project.get('name', 'Unknown')}: No tasks, skipping")
                 continue
                 
-            completed = len([t for t in project_tasks if t.get('status') == 'Completed'])
+            completed = sum(1 for t in project_tasks if t.get('status') == 'Completed')
             total = len(project_tasks)
             completion_pct = (completed / total * 100) if total > 0 else 0
             
@@ -416,7 +436,7 @@ def create_project(project: ProjectCreate, background_tasks: BackgroundTasks):
     # 4. Trigger Excel Update (in background)
     from services.excel_sync import ExcelSyncService
     excel_service = ExcelSyncService(drive_service)
-    background_tasks.add_task(excel_service.sync_to_drive, db.get_projects(), db.get_tasks())
+    background_tasks.add_task(excel_service.sync_to_drive, *fetch_parallel(db.get_projects, db.get_tasks))
     
     # 5. Auto-check reminder if rig down is within 2 days
     rig_down_str = new_project.get('rig_down_date') or new_project.get('rig_down') or ''
@@ -477,7 +497,7 @@ def delete_project(project_id: str):
         raise HTTPException(status_code=404, detail="Project not found")
     
     # Delete all tasks for this project first
-    project_tasks = db.get_tasks(project_id)
+    project_tasks = db.get_tasks(project_id, columns="id")
     for task in project_tasks:
         db.delete_task(task['id'])
     
@@ -641,7 +661,7 @@ def generate_project_report(project_id: str, mode: str = "download"):
     elements.append(Paragraph("Task Summary & Attachments", heading_style))
     
     # Task statistics
-    completed = len([t for t in tasks if t.get('status') == 'Completed'])
+    completed = sum(1 for t in tasks if t.get('status') == 'Completed')
     total_attachments = sum(len(t.get('attachments', [])) for t in tasks)
     
     stats_data = [
@@ -1077,8 +1097,10 @@ def create_task(task: dict):
     return saved_task
 
 @app.get("/tasks")
-def list_tasks(status: Optional[str] = None):
-    # This is for the "All Tasks" gallery, possibly filtered
+def list_tasks(status: Optional[str] = None, limit: Optional[int] = Query(None, ge=1, le=1000), offset: int = Query(0, ge=0)):
+    # This is for the "All Tasks" gallery, possibly filtered; limit/offset page it server-side
+    if limit is not None:
+        return db.get_tasks(limit=limit, offset=offset, status=status)
     all_tasks = db.get_tasks()
     if status:
         return [t for t in all_tasks if t.get('status') == status]
@@ -1140,8 +1162,7 @@ def debug_task(task_id: str):
     print(f"[DEBUG] Reading tasks from: {tasks_file}")
     print(f"[DEBUG] File exists: {os.path.exists(tasks_file)}")
     
-    tasks = db.get_tasks()
-    task = next((t for t in tasks if t['id'] == task_id), None)
+    task = db.get_task(task_id)
     if task:
         return {"task_id": task_id, "status": task.get('status'), "full_task": task}
     return {"error": "Task not found", "task_id": task_id}
@@ -1178,13 +1199,12 @@ async def upload_attachment(
     task_id: str, 
     file: UploadFile = File(...)
 ):
-    # 1. Get Task & Project info
-    tasks = db.get_tasks()
-    task = next((t for t in tasks if t['id'] == task_id), None)
+    # 1. Get Task & Project info (blocking DB calls run in the threadpool)
+    task = await run_in_threadpool(db.get_task, task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    project = db.get_project(task['project_id'])
+    project = await run_in_threadpool(db.get_project, task['project_id'])
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
 
@@ -1219,7 +1239,7 @@ async def upload_attachment(
         "folder_path": result.get('folder_path'),  # Store path for debugging
         "uploaded_at": datetime.now().isoformat()
     })
-    db.update_task(task_id, {"attachments": current_attachments})
+    await run_in_threadpool(db.update_task, task_id, {"attachments": current_attachments})
     
     print(f"[UPLOAD] Attachment saved: {file.filename} -> {result.get('folder_path')}")
     return {"status": "success", "filename": file.filename, "file_id": result.get('file_id')}
@@ -1317,7 +1337,7 @@ async def upload_csms_pb_attachment(pb_id: str, file: UploadFile = File(...)):
     # Save file to Google Drive
     try:
         file_content = await file.read()
-        file_id = drive_service.upload_file(file.filename, file_content)
+        file_id = await drive_service.upload_file_async(file.filename, file_content)
         
         attachment = {
             "filename": file.filename,
@@ -1329,7 +1349,9 @@ async def upload_csms_pb_attachment(pb_id: str, file: UploadFile = File(...)):
             pb_record['attachments'] = []
         pb_record['attachments'].append(attachment)
         
-        save_csms_pb_records(records)
+        # SYNCHRONOUS update of just this record - will fail loudly if Supabase fails
+        if update_csms_pb(pb_id, {"attachments": pb_record['attachments']}) is None:
+            raise RuntimeError(f"Could not save attachment on PB record {pb_id}")
         return {"status": "success", "attachment": attachment}
     except Exception as e:
         print(f"[ERROR] Failed to upload PB attachment: {e}")
@@ -1390,7 +1412,7 @@ async def create_related_doc(
         file_content = await file.read()
         
         # Upload to "RelatedDocs" subfolder
-        file_id = drive_service.upload_file(file.filename, file_content, "RelatedDocs")
+        file_id = await drive_service.upload_file_async(file.filename, file_content, "RelatedDocs")
         
         if not file_id:
             raise Exception("Failed to upload file to Google Drive")
@@ -1426,8 +1448,8 @@ def delete_related_doc_route(doc_id: str):
     return {"status": "deleted"}
 
 @app.get("/download/{file_id}")
-async def download_drive_file(file_id: str):
-    """Download a file from Google Drive by its ID"""
+def download_drive_file(file_id: str):
+    """Download a file from Google Drive by its ID (sync route: Drive calls run in the threadpool)"""
     try:
         import io
         from googleapiclient.http import MediaIoBaseDownload
@@ -1526,63 +1548,121 @@ def send_rig_down_reminder(project: dict, completion_percentage: float, incomple
         </html>
         """
         
-        # Call the global email_service
+        # Send synchronously (Vercel may freeze the function once the response is out);
+        # throttled sends are retried inside _send_email
         return email_service._send_email(recipients, subject, body_html)
         
     except Exception as e:
         print(f"[REMINDER ERROR] {e}")
         return False
 
-@app.get("/check-reminders")
-def check_and_send_reminders(background_tasks: BackgroundTasks):
-    """Check projects approaching rig down and send reminders if tasks < 95% complete"""
-    today = datetime.now().date()
+# Last summary computed by a reminder scan (background job or /check-reminders)
+REMINDER_INTERVAL_MINUTES = int(os.getenv("REMINDER_INTERVAL_MINUTES", "30"))
+_last_reminder_summary = {"reminders_sent": 0, "already_reminded": 0, "details": [], "last_run": None}
+# Background job and /check-reminders must not scan (and send) at the same time
+_reminder_scan_lock = threading.Lock()
+
+def _scan_reminders():
+    """
+    Check projects approaching rig down and send reminders if tasks < 95% complete.
+    Each project is reminded at most once per day (projects.last_reminder_date).
+    """
+    with _reminder_scan_lock:
+        return _scan_reminders_locked()
+
+def _scan_reminders_locked():
+    global _last_reminder_summary
+    today = date.today()
+    today_iso = today.isoformat()
     reminders_sent = []
+    already_reminded = 0
     
-    projects = db.get_projects()
-    all_tasks = db.get_tasks()
+    # Rig-down window and PIC filter are applied by the database
+    projects = db.get_projects_needing_reminder(today.isoformat(), (today + timedelta(days=2)).isoformat())
+    tasks_by_project = {}
+    for t in db.get_task_statuses([p['id'] for p in projects]):
+        tasks_by_project.setdefault(t.get('project_id'), []).append(t)
     
     for project in projects:
         rig_down = project.get('rig_down')
-        if not rig_down or not project.get('pic_email'):
+        if project.get('last_reminder_date') == today_iso:
+            already_reminded += 1
             continue
         
         try:
-            rig_down_date = datetime.strptime(rig_down, '%Y-%m-%d').date()
-            days_until = (rig_down_date - today).days
+            project_tasks = tasks_by_project.get(project['id'])
+            if not project_tasks:
+                continue
             
-            # Check if 2 days before rig down
-            if days_until <= 2 and days_until >= 0:
-                # Get project tasks
-                project_tasks = [t for t in all_tasks if t.get('project_id') == project['id']]
-                
-                if len(project_tasks) == 0:
-                    continue
-                
-                completed = len([t for t in project_tasks if t.get('status') == 'Completed'])
-                completion_pct = (completed / len(project_tasks)) * 100
-                
-                # Send reminder if less than 95% complete
-                if completion_pct < 95:
-                    incomplete = [t for t in project_tasks if t.get('status') != 'Completed']
-                    background_tasks.add_task(send_rig_down_reminder, project, completion_pct, incomplete)
-                    reminders_sent.append({
-                        "project": project['name'],
-                        "rig_down": rig_down,
-                        "completion": completion_pct,
-                        "pic_email": project['pic_email']
-                    })
+            # Only remind when less than 95% complete (integer check, no division)
+            completed = sum(1 for t in project_tasks if t.get('status') == 'Completed')
+            if completed * 100 >= 95 * len(project_tasks):
+                continue
+            
+            completion_pct = (completed / len(project_tasks)) * 100
+            incomplete = [t for t in project_tasks if t.get('status') != 'Completed']
+            # Stamp before sending: if the stamp can't be stored (e.g. the last_reminder_date
+            # column is missing) every scheduler run would re-send, so don't send at all
+            if not db.update_project(project['id'], {"last_reminder_date": today_iso}):
+                log_app_event("ERROR", "EMAIL", f"Could not record reminder date for {project['name']}, reminder not sent")
+                continue
+            if not send_rig_down_reminder(project, completion_pct, incomplete):
+                # Let a later scan retry today
+                db.update_project(project['id'], {"last_reminder_date": project.get('last_reminder_date')})
+                continue
+            reminders_sent.append({
+                "project": project['name'],
+                "rig_down": rig_down,
+                "completion": completion_pct,
+                "pic_email": project['pic_email']
+            })
         except Exception as e:
-            print(f"[REMINDER] Error checking project {project['name']}: {e}")
+            logger.warning("Error checking project %s for reminders: %s", project['name'], e)
     
-    return {"reminders_sent": len(reminders_sent), "details": reminders_sent}
+    _last_reminder_summary = {
+        "reminders_sent": len(reminders_sent),
+        "already_reminded": already_reminded,
+        "details": reminders_sent,
+        "last_run": datetime.now().isoformat()
+    }
+    return _last_reminder_summary
+
+reminder_scheduler = AsyncIOScheduler() if SCHEDULER_AVAILABLE else None
+
+@app.on_event("startup")
+async def start_reminder_scheduler():
+    """Run the reminder scan on a fixed interval instead of per HTTP ping"""
+    if not reminder_scheduler:
+        logger.warning("apscheduler not installed, reminders only go out via /check-reminders")
+        return
+    reminder_scheduler.add_job(
+        _scan_reminders, 'interval',
+        minutes=REMINDER_INTERVAL_MINUTES,
+        next_run_time=datetime.now(),
+        id='scan_reminders',
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
+    )
+    reminder_scheduler.start()
+    logger.info("Reminder scheduler started, scanning every %s min", REMINDER_INTERVAL_MINUTES)
+
+@app.on_event("shutdown")
+async def stop_reminder_scheduler():
+    if reminder_scheduler and reminder_scheduler.running:
+        reminder_scheduler.shutdown(wait=False)
+
+@app.get("/check-reminders")
+def check_and_send_reminders():
+    """Scan now and send any reminders still due today (also the trigger on serverless deployments)"""
+    return _scan_reminders()
 
 # --- Comments API ---
 
 @app.get("/comments")
-def list_comments():
-    """Get all comments for home screen status updates"""
-    comments = get_comments()
+def list_comments(limit: Optional[int] = Query(None, ge=1, le=1000), offset: int = Query(0, ge=0)):
+    """Get comments for home screen status updates (all, or one page when limit is given)"""
+    comments = get_comments(limit=limit, offset=offset)
     # Sort by creation date, newest first
     comments.sort(key=lambda x: x.get('created_at', ''), reverse=True)
     return comments
@@ -1597,18 +1677,23 @@ def create_comment_route(comment: CommentCreate):
         "author_name": comment.author_name,
         "content": comment.content,
         "attachment_filename": comment.attachment_filename,
-        "attachment_data": comment.attachment_data,  # Base64 data URL for images
+        "attachment_data": comment.attachment_data,  # Base64 data URL (fallback when Storage is unavailable)
         "created_at": datetime.now().isoformat(),
         "likes": 0,
         "replies": []
     }
     
+    # Store images in Supabase Storage so /comments only ships URLs
+    attachment_url = supabase_service.upload_comment_attachment(new_comment['id'], comment.attachment_filename, comment.attachment_data) if supabase_service else None
+    if attachment_url:
+        new_comment['attachment_url'] = attachment_url
+        new_comment['attachment_data'] = None
+    
     # SYNCHRONOUS save - will fail loudly if Supabase fails
     save_comment(new_comment)
-    print(f"[COMMENT] New comment by {comment.author_name}")
-    print(f"[DEBUG_COMMENT] Has Attachment: {bool(comment.attachment_data)}")
-    if comment.attachment_data:
-        print(f"[DEBUG_COMMENT] Attachment Size: {len(comment.attachment_data)} bytes")
+    logger.info("New comment by %s", comment.author_name)
+    if comment.attachment_data and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Comment attachment size: %d bytes", len(comment.attachment_data))
 
     
     return new_comment
@@ -1616,12 +1701,12 @@ def create_comment_route(comment: CommentCreate):
 @app.delete("/comments/{comment_id}")
 def delete_comment_route(comment_id: str):
     """Delete a comment (Admin only)"""
-    print(f"[DELETE_COMMENT] Deleting comment: {comment_id}")
+    logger.debug("Deleting comment: %s", comment_id)
     
     # SYNCHRONOUS delete - will fail loudly if Supabase fails
     delete_comment(comment_id)
     
-    print(f"[DELETE_COMMENT] Deleted comment: {comment_id}")
+    logger.info("Deleted comment: %s", comment_id)
     return {"status": "success", "deleted_comment": comment_id}
 
 class ReplyCreate(BaseModel):
@@ -1650,6 +1735,11 @@ def add_reply(comment_id: str, reply: ReplyCreate):
         "created_at": datetime.now().isoformat()
     }
     
+    attachment_url = supabase_service.upload_comment_attachment(f"{comment_id}/{new_reply['id']}", reply.attachment_filename, reply.attachment_data) if supabase_service else None
+    if attachment_url:
+        new_reply['attachment_url'] = attachment_url
+        new_reply['attachment_data'] = None
+    
     if 'replies' not in comment:
         comment['replies'] = []
     comment['replies'].append(new_reply)
@@ -1657,13 +1747,13 @@ def add_reply(comment_id: str, reply: ReplyCreate):
     # SYNCHRONOUS update - will fail loudly if Supabase fails
     update_comment(comment_id, {"replies": comment['replies']})
     
-    print(f"[REPLY] New reply by {reply.author_name} to comment {comment_id}")
+    logger.info("New reply by %s to comment %s", reply.author_name, comment_id)
     return new_reply
 
 @app.post("/comments/{comment_id}/like")
 def like_comment_route(comment_id: str):
     """Like a comment (increment likes counter)"""
-    comments = get_comments()
+    comments = get_comments(COMMENT_LIKE_COLUMNS)
     comment = next((c for c in comments if c.get('id') == comment_id), None)
     
     if not comment:
@@ -1674,7 +1764,7 @@ def like_comment_route(comment_id: str):
     # SYNCHRONOUS update - will fail loudly if Supabase fails
     update_comment(comment_id, {"likes": new_likes})
     
-    print(f"[LIKE] Comment {comment_id} liked, now has {new_likes} likes")
+    logger.debug("Comment %s liked, now has %d likes", comment_id, new_likes)
     return {"status": "success", "likes": new_likes}
 
 # --- Statistics API ---
@@ -1682,41 +1772,42 @@ def like_comment_route(comment_id: str):
 @app.get("/statistics")
 def get_statistics():
     """Get comprehensive statistics for dashboard"""
-    projects = db.get_projects()
-    tasks = db.get_tasks()
-    schedules = get_schedules()
+    projects, tasks, schedules = fetch_parallel(db.get_projects, db.get_tasks, get_schedules)
     
-    # Project stats
+    # Project stats (single pass per table)
+    project_status = Counter(p.get('status') for p in projects)
     project_stats = {
         "total": len(projects),
         "by_status": {
-            "Upcoming": len([p for p in projects if p.get('status') == 'Upcoming']),
-            "InProgress": len([p for p in projects if p.get('status') in ['InProgress', 'Ongoing']]),
-            "Completed": len([p for p in projects if p.get('status') == 'Completed']),
-            "OnHold": len([p for p in projects if p.get('status') == 'OnHold'])
+            "Upcoming": project_status['Upcoming'],
+            "InProgress": project_status['InProgress'] + project_status['Ongoing'],
+            "Completed": project_status['Completed'],
+            "OnHold": project_status['OnHold']
         }
     }
     
     # Task stats
+    task_status = Counter(t.get('status') for t in tasks)
     task_stats = {
         "total": len(tasks),
         "by_status": {
-            "Upcoming": len([t for t in tasks if t.get('status') == 'Upcoming']),
-            "In Progress": len([t for t in tasks if t.get('status') == 'In Progress']),
-            "Completed": len([t for t in tasks if t.get('status') == 'Completed'])
+            "Upcoming": task_status['Upcoming'],
+            "In Progress": task_status['In Progress'],
+            "Completed": task_status['Completed']
         },
-        "completion_rate": (len([t for t in tasks if t.get('status') == 'Completed']) / max(len(tasks), 1)) * 100,
-        "with_attachments": len([t for t in tasks if t.get('attachments') and len(t['attachments']) > 0])
+        "completion_rate": (task_status['Completed'] / max(len(tasks), 1)) * 100,
+        "with_attachments": sum(1 for t in tasks if t.get('attachments'))
     }
     
     # Schedule stats - handle None values for different schedule types
-    today = datetime.now().date()
+    today = date.today()
+    today_m, today_y = today.month, today.year
     
     def safe_parse_date(date_str):
         if date_str:
             try:
-                return datetime.strptime(date_str, '%Y-%m-%d').date()
-            except:
+                return date.fromisoformat(date_str)
+            except (TypeError, ValueError):
                 return None
         return None
     
@@ -1728,7 +1819,7 @@ def get_statistics():
     for s in schedules:
         for field in ['mwt_plan_date', 'hse_meeting_date', 'csms_pb_date', 'hseplan_date', 'spr_date', 'hazid_date']:
             date_val = safe_parse_date(s.get(field))
-            if date_val and date_val.month == today.month and date_val.year == today.year:
+            if date_val and date_val.month == today_m and date_val.year == today_y:
                 this_month_count += 1
                 break
     
@@ -1743,7 +1834,7 @@ def get_statistics():
     project_completion = []
     for p in projects[:10]:  # Top 10
         proj_tasks = [t for t in tasks if t.get('project_id') == p['id']]
-        completed = len([t for t in proj_tasks if t.get('status') == 'Completed'])
+        completed = sum(1 for t in proj_tasks if t.get('status') == 'Completed')
         total = len(proj_tasks)
         project_completion.append({
             "name": p['name'][:20],
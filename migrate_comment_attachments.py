@@ -0,0 +1,53 @@
+"""
+One-shot migration: move base64 comment/reply images out of the comments
+table into the Supabase Storage bucket and store their public URLs instead.
+
+Run schema.sql first so the `attachment_url` column exists, and create a
+public bucket named `comment-attachments` (or set SUPABASE_COMMENT_BUCKET).
+"""
+from dotenv import load_dotenv
+load_dotenv()
+
+from services.supabase_service import supabase_service
+
+
+def migrate_comment_attachments():
+    print("🚀 Moving comment attachments to Supabase Storage...")
+
+    if not supabase_service.enabled:
+        print("❌ Supabase is NOT enabled. Please set SUPABASE_URL and SUPABASE_KEY first.")
+        return
+
+    comments = supabase_service.get_comments()
+    print(f"📦 Found {len(comments)} comments")
+    moved = 0
+
+    for c in comments:
+        updates = {}
+
+        url = supabase_service.upload_comment_attachment(c['id'], c.get('attachment_filename'), c.get('attachment_data'))
+        if url:
+            updates['attachment_url'] = url
+            updates['attachment_data'] = None
+
+        replies = c.get('replies') or []
+        replies_changed = False
+        for r in replies:
+            url = supabase_service.upload_comment_attachment(f"{c['id']}/{r.get('id')}", r.get('attachment_filename'), r.get('attachment_data'))
+            if url:
+                r['attachment_url'] = url
+                r['attachment_data'] = None
+                replies_changed = True
+        if replies_changed:
+            updates['replies'] = replies
+
+        if updates:
+            supabase_service.update_comment(c['id'], updates)
+            moved += 1
+            print(f"   ✅ Migrated attachments for comment {c['id']}")
+
+    print(f"\n✨ Migration Complete! Updated {moved} comment(s)")
+
+
+if __name__ == "__main__":
+    migrate_comment_attachments()
@@ -22,14 +22,9 @@ async def migrate_data():
         with open(PROJECTS_FILE, 'r') as f:
             projects = json.load(f)
             print(f"📦 Found {len(projects)} projects")
-            for p in projects:
-                # Check if exists first to avoid duplicates
-                existing = supabase_service.get_project(p['id'])
-                if not existing:
-                    supabase_service.create_project(p)
-                    print(f"   ✅ Migrated project: {p.get('name')}")
-                else:
-                    print(f"   ⚠️ Skipping existing project: {p.get('name')}")
+            # One bulk insert; projects that already exist are left untouched
+            supabase_service.batch_upsert('projects', projects, ignore_duplicates=True)
+            print(f"   ✅ Migrated {len(projects)} projects (existing ones skipped)")
 
     # 2. Migrate Tasks
     if os.path.exists(TASKS_FILE):
@@ -51,18 +46,16 @@ async def migrate_data():
         with open(SCHEDULES_FILE, 'r') as f:
             schedules = json.load(f)
             print(f"📦 Found {len(schedules)} schedules")
-            for s in schedules:
-                supabase_service.save_schedule(s)
-                print(f"   ✅ Migrated schedule: {s.get('title')}")
+            supabase_service.batch_upsert('schedules', schedules, ignore_duplicates=True)
+            print(f"   ✅ Migrated {len(schedules)} schedules (existing ones skipped)")
 
     # 4. Migrate Comments
     if os.path.exists(COMMENTS_FILE):
         with open(COMMENTS_FILE, 'r') as f:
             comments = json.load(f)
             print(f"📦 Found {len(comments)} comments")
-            for c in comments:
-                supabase_service.save_comment(c)
-                print("   ✅ Migrated comment")
+            supabase_service.batch_upsert('comments', comments, ignore_duplicates=True)
+            print(f"   ✅ Migrated {len(comments)} comments (existing ones skipped)")
 
     print("\n✨ Migration Complete!")
 
@@ -82,19 +82,20 @@ async def preview_source_data(
     Preview the data extracted from the source file.
     """
     try:
-        source_content = await source_file.read()
-        
-        data = []
-        if source_file.filename.lower().endswith('.xlsx') or source_file.filename.lower().endswith('.xls'):
-            data = report_engine.parse_excel_source(source_content)
-        elif source_file.filename.lower().endswith('.pdf'):
-            data = report_engine.parse_pdf_source(source_content)
+        # Parse straight from the spooled upload; Excel stops building records after the first 5
+        filename = source_file.filename.lower()
+        if filename.endswith('.xlsx') or filename.endswith('.xls'):
+            data, record_count = report_engine.parse_excel_source_head(source_file.file, n=5)
+        elif filename.endswith('.pdf'):
+            # Full parse: the training section sits past page 1, so a page-limited preview misses it
+            data = report_engine.parse_pdf_source(source_file.file)['records']
+            record_count = len(data)
         else:
             raise HTTPException(status_code=400, detail="Unsupported source file type")
             
         return {
             "filename": source_file.filename,
-            "record_count": len(data),
+            "record_count": record_count,
             "preview": data[:5] # Show first 5 records
         }
         
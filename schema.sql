@@ -17,8 +17,15 @@ CREATE TABLE IF NOT EXISTS projects (
     pic_name TEXT,
     pic_email TEXT,
     pic_manager_email TEXT,
+    last_reminder_date DATE, -- day the rig-down reminder last went out (one per project per day)
     created_at TIMESTAMPTZ DEFAULT NOW()
 );
+-- Existing deployments: add the reminder sent-marker column
+ALTER TABLE projects ADD COLUMN IF NOT EXISTS last_reminder_date DATE;
+-- Rig-down reminder scan only looks at projects with a (non-empty) PIC email;
+-- dropped first so existing deployments pick up the narrower predicate
+DROP INDEX IF EXISTS idx_projects_rig_down_pic;
+CREATE INDEX IF NOT EXISTS idx_projects_rig_down_pic ON projects(rig_down) WHERE pic_email IS NOT NULL AND pic_email <> '';
 
 -- 2. Tasks Table
 CREATE TABLE IF NOT EXISTS tasks (
@@ -61,11 +68,14 @@ CREATE TABLE IF NOT EXISTS comments (
     author_name TEXT,
     content TEXT,
     attachment_filename TEXT,
-    attachment_data TEXT, -- Base64 data if needed, or link
+    attachment_data TEXT, -- Base64 data (legacy / fallback when Storage is unavailable)
+    attachment_url TEXT, -- Public URL in the 'comment-attachments' Storage bucket
     likes INTEGER DEFAULT 0,
     replies JSONB DEFAULT '[]'::jsonb,
     created_at TIMESTAMPTZ DEFAULT NOW()
 );
+-- Existing deployments: add the Storage URL column (see migrate_comment_attachments.py)
+ALTER TABLE comments ADD COLUMN IF NOT EXISTS attachment_url TEXT;
 
 -- 5. CSMS PB (Performance Board) Records
 CREATE TABLE IF NOT EXISTS csms_pb (
@@ -99,6 +109,12 @@ CREATE TABLE IF NOT EXISTS app_logs (
     created_at TIMESTAMPTZ DEFAULT NOW()
 );
 
+-- Existing deployments: the app used to store attachments/replies as JSON-encoded
+-- strings inside these JSONB columns; unwrap them into native arrays
+UPDATE tasks SET attachments = (attachments #>> '{}')::jsonb WHERE jsonb_typeof(attachments) = 'string';
+UPDATE comments SET replies = (replies #>> '{}')::jsonb WHERE jsonb_typeof(replies) = 'string';
+UPDATE csms_pb SET attachments = (attachments #>> '{}')::jsonb WHERE jsonb_typeof(attachments) = 'string';
+
 -- Enable Row Level Security (RLS) is generally good practice, 
 -- but for initial service account usage we often just need existing tables.
 -- If you access this from client-side JS directly, you'll need Policies.
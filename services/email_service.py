@@ -1,9 +1,57 @@
 import os
+import logging
+import random
+import time
 import requests
 import json
 from datetime import datetime
 from typing import List, Dict, Optional
 
+# Brevo rate-limits bursts; retry throttled sends instead of dropping them
+MAX_SEND_ATTEMPTS = 3
+RETRYABLE_STATUS = (429, 503)
+MAX_RETRY_DELAY = 30
+
+logger = logging.getLogger(__name__)
+
+# Shared markup for the key/value tables used by every notification email
+_CELL_STYLE = "padding: 10px; border: 1px solid #ddd;"
+_ROW = (
+    '<tr style="background: #fff;">'
+    '<td style="' + _CELL_STYLE + '"><strong>{label}</strong></td>'
+    '<td style="' + _CELL_STYLE + '{value_style}">{value}</td>'
+    '</tr>'
+).format
+_HIGHLIGHT = " color: {color}; font-weight: bold;"
+
+
+def _rows(fields: List[tuple]) -> str:
+    """Render (label, value, value_style) tuples as table rows"""
+    return ''.join(_ROW(label=label, value=value, value_style=style or '') for label, value, style in fields)
+
+
+def _email_html(title: str, color: str, intro: str, fields: List[tuple], closing: str, greeting: str = "Dear Team,",
+                table_margin: Optional[str] = "20px 0") -> str:
+    """Wrap a key/value table in the standard CSMS email layout (table_margin=None for no table margin)"""
+    margin = f" margin: {table_margin};" if table_margin else ""
+    return f"""
+        <html>
+        <body style="font-family: Arial, sans-serif; padding: 20px;">
+            <div style="background: {color}; color: white; padding: 20px; border-radius: 8px;">
+                <h2 style="margin: 0;">{title}</h2>
+            </div>
+            <div style="padding: 20px; background: #f5f5f5; border-radius: 8px; margin-top: 10px;">
+                <p>{greeting}</p>
+                <p>{intro}</p>
+                <table style="width: 100%; border-collapse: collapse;{margin}">{_rows(fields)}</table>
+                {closing}
+                <p>Best regards,<br><strong>CSMS Project Management System</strong><br>PHM</p>
+            </div>
+        </body>
+        </html>
+        """
+
+
 class EmailService:
     def __init__(self):
         self.api_key = os.getenv('BREVO_API_KEY')
@@ -14,14 +62,22 @@ class EmailService:
         if not self.api_key:
             print("[WARN] BREVO_API_KEY not set in environment variables")
 
+    def _retry_delay(self, response, attempt: int) -> float:
+        """Seconds to wait before retrying, honouring Retry-After when Brevo sends it"""
+        try:
+            delay = float(response.headers.get('Retry-After'))
+        except (TypeError, ValueError):
+            delay = 2 ** attempt
+        return min(delay, MAX_RETRY_DELAY) + random.uniform(0, 0.5)
+
     def _send_email(self, to_emails: List[str], subject: str, html_content: str, cc_emails: List[str] = None) -> bool:
         """Base method to send email using Brevo API"""
         if not self.api_key:
-            print("[EMAIL ERROR] Cannot send email: API key missing")
+            logger.error("Cannot send email: API key missing")
             return False
             
         if not to_emails:
-            print("[EMAIL ERROR] No recipients provided")
+            logger.error("Cannot send email: no recipients provided")
             return False
             
         headers = {
@@ -41,15 +97,20 @@ class EmailService:
             payload["cc"] = [{"email": email} for email in cc_emails]
             
         try:
-            response = requests.post(self.api_url, json=payload, headers=headers)
-            if response.status_code in [200, 201, 202]:
-                print(f"[EMAIL] Successfully sent email: '{subject}' to {to_emails}")
-                return True
-            else:
-                print(f"[EMAIL ERROR] Failed to send: {response.status_code} - {response.text}")
+            for attempt in range(MAX_SEND_ATTEMPTS):
+                response = requests.post(self.api_url, json=payload, headers=headers, timeout=30)
+                if response.status_code in [200, 201, 202]:
+                    logger.info("Sent email '%s' to %s", subject, to_emails)
+                    return True
+                if response.status_code in RETRYABLE_STATUS and attempt < MAX_SEND_ATTEMPTS - 1:
+                    delay = self._retry_delay(response, attempt)
+                    logger.warning("Brevo returned %s, retrying in %.1fs", response.status_code, delay)
+                    time.sleep(delay)
+                    continue
+                logger.error("Failed to send email: %s - %s", response.status_code, response.text)
                 return False
         except Exception as e:
-            print(f"[EMAIL ERROR] Exception sending email: {e}")
+            logger.exception("Exception sending email: %s", e)
             return False
 
     def send_schedule_notification(self, schedule: Dict) -> bool:
@@ -79,39 +140,21 @@ class EmailService:
         
         subject = f"Schedule Reminder: {schedule_name} - {schedule.get('project_name', 'Unknown Project')}"
         
-        body_html = f"""
-        <html>
-        <body style="font-family: Arial, sans-serif; padding: 20px;">
-            <div style="background: {schedule_color}; color: white; padding: 20px; border-radius: 8px;">
-                <h2 style="margin: 0;">{schedule_name} Reminder</h2>
-            </div>
-            <div style="padding: 20px; background: #f5f5f5; border-radius: 8px; margin-top: 10px;">
-                <p>Dear <strong>{schedule.get('pic_name', 'User')}</strong>,</p>
-                <p>This is a reminder for your upcoming <strong>{schedule_name}</strong> schedule:</p>
-                <table style="width: 100%; border-collapse: collapse;">
-                    <tr style="background: #fff;">
-                        <td style="padding: 10px; border: 1px solid #ddd;"><strong>Project</strong></td>
-                        <td style="padding: 10px; border: 1px solid #ddd;">{schedule.get('project_name', '-')}</td>
-                    </tr>
-                    <tr style="background: #fff;">
-                        <td style="padding: 10px; border: 1px solid #ddd;"><strong>Well</strong></td>
-                        <td style="padding: 10px; border: 1px solid #ddd;">{schedule.get('well_name', '-')}</td>
-                    </tr>
-                    <tr style="background: #fff;">
-                        <td style="padding: 10px; border: 1px solid #ddd;"><strong>Schedule Type</strong></td>
-                        <td style="padding: 10px; border: 1px solid #ddd; color: {schedule_color}; font-weight: bold;">{schedule_name}</td>
-                    </tr>
-                    <tr style="background: #fff;">
-                        <td style="padding: 10px; border: 1px solid #ddd;"><strong>Date</strong></td>
-                        <td style="padding: 10px; border: 1px solid #ddd; color: {schedule_color}; font-weight: bold;">{schedule_date}</td>
-                    </tr>
-                </table>
-                <p style="margin-top: 20px;">Please mark this date in your calendar and prepare accordingly.</p>
-                <p>Best regards,<br><strong>CSMS Project Management System</strong><br>PHM</p>
-            </div>
-        </body>
-        </html>
-        """
+        highlight = _HIGHLIGHT.format(color=schedule_color)
+        body_html = _email_html(
+            title=f"{schedule_name} Reminder",
+            color=schedule_color,
+            greeting=f"Dear <strong>{schedule.get('pic_name', 'User')}</strong>,",
+            intro=f"This is a reminder for your upcoming <strong>{schedule_name}</strong> schedule:",
+            fields=[
+                ("Project", schedule.get('project_name', '-'), None),
+                ("Well", schedule.get('well_name', '-'), None),
+                ("Schedule Type", schedule_name, highlight),
+                ("Date", schedule_date, highlight),
+            ],
+            closing='<p style="margin-top: 20px;">Please mark this date in your calendar and prepare accordingly.</p>',
+            table_margin=None
+        )
         
         return self._send_email([recipient], subject, body_html)
 
@@ -139,39 +182,18 @@ class EmailService:
             subject = f"[REMINDER] Project: {project['name']} - Rig Down in {days_until} Day(s)"
             intro = f"This is a reminder that the repository has <strong style='color:#E50914;'>rig down in {days_until} day(s)</strong>."
 
-        body_html = f"""
-        <html>
-        <body style="font-family: Arial, sans-serif; padding: 20px;">
-            <div style="background: #E50914; color: white; padding: 20px; border-radius: 8px;">
-                <h2 style="margin: 0;">{title}</h2>
-            </div>
-            <div style="padding: 20px; background: #f5f5f5; border-radius: 8px; margin-top: 10px;">
-                <p>Dear Team,</p>
-                <p>{intro}</p>
-                <table style="width: 100%; border-collapse: collapse; margin: 20px 0;">
-                    <tr style="background: #fff;">
-                        <td style="padding: 10px; border: 1px solid #ddd;"><strong>Project</strong></td>
-                        <td style="padding: 10px; border: 1px solid #ddd;">{project['name']}</td>
-                    </tr>
-                    <tr style="background: #fff;">
-                        <td style="padding: 10px; border: 1px solid #ddd;"><strong>Well</strong></td>
-                        <td style="padding: 10px; border: 1px solid #ddd;">{project.get('well_name') or project.get('well', 'N/A')}</td>
-                    </tr>
-                    <tr style="background: #fff;">
-                        <td style="padding: 10px; border: 1px solid #ddd;"><strong>Rig Down Date</strong></td>
-                        <td style="padding: 10px; border: 1px solid #ddd; color: #E50914; font-weight: bold;">{rig_down_str}</td>
-                    </tr>
-                    <tr style="background: #fff;">
-                        <td style="padding: 10px; border: 1px solid #ddd;"><strong>Total Tasks</strong></td>
-                        <td style="padding: 10px; border: 1px solid #ddd;">{total_tasks}</td>
-                    </tr>
-                </table>
-                <p style="color: #E50914; font-weight: bold;">Please prioritize tasks before rig down.</p>
-                <p>Best regards,<br><strong>CSMS Project Management System</strong><br>PHM</p>
-            </div>
-        </body>
-        </html>
-        """
+        body_html = _email_html(
+            title=title,
+            color="#E50914",
+            intro=intro,
+            fields=[
+                ("Project", project['name'], None),
+                ("Well", project.get('well_name') or project.get('well', 'N/A'), None),
+                ("Rig Down Date", rig_down_str, _HIGHLIGHT.format(color="#E50914")),
+                ("Total Tasks", total_tasks, None),
+            ],
+            closing='<p style="color: #E50914; font-weight: bold;">Please prioritize tasks before rig down.</p>'
+        )
         
         return self._send_email(recipients, subject, body_html, cc_emails)
 
@@ -190,39 +212,18 @@ class EmailService:
         
         subject = f"[REMINDER] Project: {project['name']} - {completion_pct:.0f}% Complete"
         
-        body_html = f"""
-        <html>
-        <body style="font-family: Arial, sans-serif; padding: 20px;">
-            <div style="background: #E50914; color: white; padding: 20px; border-radius: 8px;">
-                <h2 style="margin: 0;">[REMINDER] Project Completion Alert</h2>
-            </div>
-            <div style="padding: 20px; background: #f5f5f5; border-radius: 8px; margin-top: 10px;">
-                <p>Dear Team,</p>
-                <p>This is a reminder that the following project has <strong style="color:#E50914;">rig down in {days_until} day(s)</strong> but is only <strong>{completion_pct:.0f}% complete</strong>.</p>
-                <table style="width: 100%; border-collapse: collapse; margin: 20px 0;">
-                    <tr style="background: #fff;">
-                        <td style="padding: 10px; border: 1px solid #ddd;"><strong>Project</strong></td>
-                        <td style="padding: 10px; border: 1px solid #ddd;">{project['name']}</td>
-                    </tr>
-                    <tr style="background: #fff;">
-                        <td style="padding: 10px; border: 1px solid #ddd;"><strong>Rig Down Date</strong></td>
-                        <td style="padding: 10px; border: 1px solid #ddd; color: #E50914; font-weight: bold;">{rig_down_str}</td>
-                    </tr>
-                    <tr style="background: #fff;">
-                        <td style="padding: 10px; border: 1px solid #ddd;"><strong>Completion</strong></td>
-                        <td style="padding: 10px; border: 1px solid #ddd;">{completed_tasks}/{total_tasks} tasks ({completion_pct:.0f}%)</td>
-                    </tr>
-                    <tr style="background: #fff;">
-                        <td style="padding: 10px; border: 1px solid #ddd;"><strong>Remaining Tasks</strong></td>
-                        <td style="padding: 10px; border: 1px solid #ddd; color: #E50914;">{total_tasks - completed_tasks} tasks to complete</td>
-                    </tr>
-                </table>
-                <p style="color: #E50914; font-weight: bold;">Please prioritize completing the remaining tasks before rig down.</p>
-                <p>Best regards,<br><strong>CSMS Project Management System</strong><br>PHM</p>
-            </div>
-        </body>
-        </html>
-        """
+        body_html = _email_html(
+            title="[REMINDER] Project Completion Alert",
+            color="#E50914",
+            intro=f'This is a reminder that the following project has <strong style="color:#E50914;">rig down in {days_until} day(s)</strong> but is only <strong>{completion_pct:.0f}% complete</strong>.',
+            fields=[
+                ("Project", project['name'], None),
+                ("Rig Down Date", rig_down_str, _HIGHLIGHT.format(color="#E50914")),
+                ("Completion", f"{completed_tasks}/{total_tasks} tasks ({completion_pct:.0f}%)", None),
+                ("Remaining Tasks", f"{total_tasks - completed_tasks} tasks to complete", " color: #E50914;"),
+            ],
+            closing='<p style="color: #E50914; font-weight: bold;">Please prioritize completing the remaining tasks before rig down.</p>'
+        )
         
         return self._send_email(recipients, subject, body_html, cc_emails)
 
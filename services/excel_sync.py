@@ -1,13 +1,108 @@
 
+import asyncio
 import io
+import operator
 import os
+import re
+import zipfile
 from datetime import datetime
-from typing import List, Dict
-try:
-    from openpyxl import Workbook
-    from openpyxl.styles import Font, PatternFill
-except ImportError:
-    Workbook = None
+from typing import List, Dict, Optional
+from xml.sax.saxutils import escape
+
+PROJECT_HEADERS = ["ID", "Name", "Status", "Start Date", "End Date", "Description", "Created At"]
+TASK_HEADERS = ["Project ID", "Task Title", "Code", "Category", "Status", "Attachment Info"]
+
+PROJECT_FIELDS = ('id', 'name', 'status', 'start_date', 'end_date', 'description', 'created_at')
+TASK_FIELDS = ('project_id', 'title', 'code', 'category', 'status', 'attachments')
+_project_fields = operator.itemgetter(*PROJECT_FIELDS)
+_task_fields = operator.itemgetter(*TASK_FIELDS)
+
+def _project_row(p: Dict) -> tuple:
+    try:
+        return _project_fields(p)
+    except KeyError:  # JSON fallback rows may miss columns
+        return tuple(p.get(k) for k in PROJECT_FIELDS)
+
+def _task_row(t: Dict) -> tuple:
+    try:
+        row = _task_fields(t)
+    except KeyError:
+        row = tuple(t.get(k) for k in TASK_FIELDS)
+    return row[:5] + (("No", "Yes")[bool(row[5])],)
+
+# Low-cardinality columns (status, category, Yes/No) go through the sharedStrings table
+PROJECT_SHARED_COLUMNS = frozenset({2})
+TASK_SHARED_COLUMNS = frozenset({3, 4, 5})
+
+# Static SpreadsheetML parts for a two-sheet workbook (Projects, Tasks)
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet2.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+    '</Types>'
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="Projects" sheetId="1" r:id="rId1"/><sheet name="Tasks" sheetId="2" r:id="rId2"/></sheets>'
+    '</workbook>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet2.xml"/>'
+    '<Relationship Id="rId3" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" Target="sharedStrings.xml"/>'
+    '</Relationships>'
+)
+_SHEET_OPEN = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_SHEET_CLOSE = '</sheetData></worksheet>'
+
+# Characters XML 1.0 does not allow (openpyxl rejects these too)
+_ILLEGAL_XML_CHARS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+def _cell(value, shared: Optional[Dict[str, int]] = None) -> str:
+    if value is None:
+        return '<c/>'
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c><v>{value}</v></c>'
+    text = escape(_ILLEGAL_XML_CHARS.sub('', str(value)))
+    if shared is not None:
+        index = shared.setdefault(text, len(shared))
+        return f'<c t="s"><v>{index}</v></c>'
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+def _sheet_xml(headers: List[str], rows, shared: Dict[str, int], shared_columns=frozenset()) -> str:
+    parts = [_SHEET_OPEN, '<row r="1">', ''.join(_cell(h) for h in headers), '</row>']
+    for r, row in enumerate(rows, start=2):
+        cells = "".join(_cell(v, shared if i in shared_columns else None) for i, v in enumerate(row))
+        parts.append(f'<row r="{r}">{cells}</row>')
+    parts.append(_SHEET_CLOSE)
+    return ''.join(parts)
+
+def _shared_strings_xml(shared: Dict[str, int]) -> str:
+    # dicts keep insertion order, which is the index order assigned in _cell
+    items = ''.join(f'<si><t xml:space="preserve">{text}</t></si>' for text in shared)
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" uniqueCount="{len(shared)}">'
+        f'{items}</sst>'
+    )
 
 class ExcelSyncService:
     def __init__(self, drive_service):
@@ -19,7 +114,12 @@ class ExcelSyncService:
             return
 
         print("[INFO] Generating Excel report in memory...")
-        file_data = self._generate_excel(projects, tasks)
+        # Building the workbook is CPU work; keep it off the event loop. The reports folder
+        # is resolved at the same time and handed to the upload, which then skips its own lookup.
+        file_data, folder_id = await asyncio.gather(
+            asyncio.to_thread(self._generate_excel, projects, tasks),
+            asyncio.to_thread(self.drive_service.resolve_target_folder, "CSMS_REPORTS")
+        )
         
         if not file_data:
             print("[ERROR] Failed to generate Excel data")
@@ -29,46 +129,31 @@ class ExcelSyncService:
         await self.drive_service.upload_file_to_drive(
             file_data=file_data,
             filename=f"CSMS_Track_Report_{datetime.now().strftime('%Y-%m-%d')}.xlsx",
-            project_name="CSMS_REPORTS"
+            project_name="CSMS_REPORTS",
+            folder_id=folder_id
         )
         
-    def _generate_excel(self, projects: List[Dict], tasks: List[Dict]) -> bytes:
-        if not Workbook:
-            print("[ERROR] openpyxl not installed. Skipping Excel generation.")
-            return None
-
+    def _generate_excel(self, projects: List[Dict], tasks: List[Dict]) -> Optional[io.BytesIO]:
+        """Write the xlsx as SpreadsheetML directly (no openpyxl Cell objects per value)"""
         try:
-            wb = Workbook()
-            
-            # Sheet 1: Projects
-            ws_p = wb.active
-            ws_p.title = "Projects"
-            headers_p = ["ID", "Name", "Status", "Start Date", "End Date", "Description", "Created At"]
-            ws_p.append(headers_p)
-            
-            for p in projects:
-                ws_p.append([
-                    p.get('id'), p.get('name'), p.get('status'), 
-                    p.get('start_date'), p.get('end_date'), 
-                    p.get('description'), p.get('created_at')
-                ])
-
-            # Sheet 2: Tasks
-            ws_t = wb.create_sheet("Tasks")
-            headers_t = ["Project ID", "Task Title", "Code", "Category", "Status", "Attachment Info"]
-            ws_t.append(headers_t)
-            
-            for t in tasks:
-                att_info = "Yes" if t.get('attachments') else "No"
-                ws_t.append([
-                    t.get('project_id'), t.get('title'), t.get('code'),
-                    t.get('category'), t.get('status'), att_info
-                ])
-
-            # Save to memory instead of file
-            output = io.BytesIO()
-            wb.save(output)
-            return output.getvalue()
+            project_rows = map(_project_row, projects)
+            task_rows = map(_task_row, tasks)
+
+            # Save to memory instead of file; the buffer itself is uploaded (no bytes copy).
+            # Pre-size it from the row count so the zip writer doesn't keep growing it.
+            output = io.BytesIO(bytes(max(64 * 1024, 256 * (len(projects) + len(tasks)))))
+            with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+                zf.writestr('[Content_Types].xml', _CONTENT_TYPES)
+                zf.writestr('_rels/.rels', _ROOT_RELS)
+                zf.writestr('xl/workbook.xml', _WORKBOOK)
+                zf.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+                shared = {}
+                zf.writestr('xl/worksheets/sheet1.xml', _sheet_xml(PROJECT_HEADERS, project_rows, shared, PROJECT_SHARED_COLUMNS))
+                zf.writestr('xl/worksheets/sheet2.xml', _sheet_xml(TASK_HEADERS, task_rows, shared, TASK_SHARED_COLUMNS))
+                zf.writestr('xl/sharedStrings.xml', _shared_strings_xml(shared))
+            output.truncate()
+            output.seek(0)
+            return output
         except Exception as e:
             print(f"[ExcelSyncService] Error: {e}")
             return None
@@ -7,16 +7,59 @@ from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaInMemoryUpload
+from googleapiclient.http import MediaInMemoryUpload, MediaIoBaseUpload
+import io
 import os
+import hashlib
 import json
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
+from typing import Union, BinaryIO
 from dotenv import load_dotenv
 
 load_dotenv()
 
 SCOPES = ['https://www.googleapis.com/auth/drive.file', 'https://www.googleapis.com/auth/drive']
 
+# Files up to this size go up in one multipart request; larger ones use
+# resumable uploads with big chunks instead of the 512KB library default
+SINGLE_SHOT_UPLOAD_LIMIT = 25 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 100 * 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 100 * 1024 * 1024
+
+def _in_memory_media(data: Union[bytes, BinaryIO]):
+    if isinstance(data, bytes):
+        if len(data) <= SINGLE_SHOT_UPLOAD_LIMIT:
+            return MediaInMemoryUpload(data, resumable=False)
+        return MediaInMemoryUpload(data, chunksize=UPLOAD_CHUNK_SIZE, resumable=True)
+    
+    # File-like (e.g. the Excel report's BytesIO): upload from it without copying to bytes
+    data.seek(0, io.SEEK_END)
+    size = data.tell()
+    data.seek(0)
+    if size <= SINGLE_SHOT_UPLOAD_LIMIT:
+        return MediaIoBaseUpload(data, mimetype='application/octet-stream', resumable=False)
+    return MediaIoBaseUpload(data, mimetype='application/octet-stream', chunksize=UPLOAD_CHUNK_SIZE, resumable=True)
+
+FOLDER_MIME = 'application/vnd.google-apps.folder'
+
+# Drive query templates, filled with str.format per lookup
+_FOLDER_QUERY = "name='{name}' and '{parent}' in parents and mimeType='" + FOLDER_MIME + "' and trashed=false"
+_FOLDER_PREFIX_QUERY = "(name = '{name}' or name contains '{name} ') and '{parent}' in parents and mimeType='" + FOLDER_MIME + "' and trashed=false"
+_FILE_BY_NAME_QUERY = "name='{name}' and trashed=false and mimeType!='" + FOLDER_MIME + "'"
+_FILES_IN_FOLDER_QUERY = "'{parent}' in parents and trashed=false and mimeType!='" + FOLDER_MIME + "'"
+_FILE_IN_FOLDER_QUERY = "name='{name}' and '{parent}' in parents and trashed=false"
+
+# Resolved folder IDs are reused for this long so renames/deletes in Drive recover
+FOLDER_CACHE_TTL = 300
+
+# Blocking Drive calls from async routes run on this pool instead of the event loop
+DRIVE_WORKERS = int(os.getenv("DRIVE_WORKERS", "16"))
+
 class GoogleDriveService:
     def __init__(self):
         self.folder_id = os.getenv("GOOGLE_DRIVE_FOLDER_ID", "")
@@ -25,7 +68,11 @@ class GoogleDriveService:
         self.service_account_json = os.getenv("SERVICE_ACCOUNT_JSON", "")
         self.service = None
         self.enabled = False
-        self.folders_cache = {}
+        self.folders_cache = {}  # (parent_id, folder_name, prefix_search) -> (folder_id, expires_at)
+        self._folder_locks = {}  # (parent_id, folder_name) -> Lock, so concurrent lookups don't double-create
+        self._folder_locks_guard = threading.Lock()
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=DRIVE_WORKERS, thread_name_prefix="drive")
         self.auth_method = None  # Track which auth method was used
         
         print("[INFO] Initializing Google Drive Service...")
@@ -50,6 +97,22 @@ class GoogleDriveService:
             traceback.print_exc()
             self.enabled = False
     
+    @property
+    def service(self):
+        """Drive client for the calling thread (the underlying httplib2 connection is not thread-safe)"""
+        if self._service is None or threading.current_thread() is threading.main_thread():
+            return self._service
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            service = build('drive', 'v3', credentials=self._service._http.credentials)
+            self._local.service = service
+        return service
+
+    @service.setter
+    def service(self, value):
+        self._service = value
+        self._local = threading.local()
+
     def _get_drive_service(self):
         """Get Google Drive service - try OAuth first, then Service Account fallback"""
         
@@ -132,8 +195,20 @@ class GoogleDriveService:
                 except Exception as e:
                     print(f"[ERROR] Auto-refresh failed: {e}")
 
+    def _cache_folder(self, cache_key: tuple, folder_id: str):
+        self.folders_cache[cache_key] = (folder_id, time.monotonic() + FOLDER_CACHE_TTL)
+
+    def _folder_lock(self, parent_id: str, folder_name: str) -> threading.Lock:
+        with self._folder_locks_guard:
+            return self._folder_locks.setdefault((parent_id, folder_name), threading.Lock())
+
     def find_or_create_folder(self, folder_name: str, parent_id: str = None, prefix_search: bool = False) -> str:
         """Find existing folder or create new one by name."""
+        # Concurrent lookups of the same folder wait for the first one and then hit the cache
+        with self._folder_lock(parent_id or self.folder_id, folder_name):
+            return self._find_or_create_folder(folder_name, parent_id, prefix_search)
+
+    def _find_or_create_folder(self, folder_name: str, parent_id: str = None, prefix_search: bool = False) -> str:
         if not self.enabled or not self.service:
             print("[WARN] Drive not enabled")
             return None
@@ -142,20 +217,23 @@ class GoogleDriveService:
         try:
             parent_id = parent_id or self.folder_id
             
-            # Check cache (Exact match only for cache safety)
-            cache_key = f"{parent_id}:{folder_name}"
-            if not prefix_search and cache_key in self.folders_cache:
+            cache_key = (parent_id, folder_name, prefix_search)
+            cached = self.folders_cache.get(cache_key)
+            if cached and cached[1] > time.monotonic():
                 print(f"[CACHE] Using cached folder: {folder_name}")
-                return self.folders_cache[cache_key]
+                return cached[0]
             
             # Search Query
             if prefix_search:
                 # Find folders starting with "Name " (with space) or exactly "Name" to avoid 2.1 matching 2.10
-                query = f"(name = '{folder_name}' or name contains '{folder_name} ') and '{parent_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false"
+                query = _FOLDER_PREFIX_QUERY.format(name=folder_name, parent=parent_id)
             else:
-                query = f"name='{folder_name}' and '{parent_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false"
+                query = _FOLDER_QUERY.format(name=folder_name, parent=parent_id)
                 
-            results = self.service.files().list(q=query, spaces='drive', fields='files(id, name)').execute()
+            results = self.service.files().list(
+                q=query, spaces='drive', fields='files(id, name)',
+                supportsAllDrives=True, includeItemsFromAllDrives=True
+            ).execute()
             files = results.get('files', [])
             
             if files:
@@ -164,9 +242,9 @@ class GoogleDriveService:
                 files.sort(key=lambda x: (x['name'] != folder_name, x['name']))
                 folder_id = files[0]['id']
                 
-                # Update cache only if exact match
+                self._cache_folder(cache_key, folder_id)
                 if files[0]['name'] == folder_name:
-                    self.folders_cache[cache_key] = folder_id
+                    self._cache_folder((parent_id, folder_name, False), folder_id)
                 
                 print(f"[FOUND] Existing folder: {files[0]['name']}")
                 return folder_id
@@ -177,12 +255,14 @@ class GoogleDriveService:
             
             file_metadata = {
                 'name': folder_name,
-                'mimeType': 'application/vnd.google-apps.folder',
+                'mimeType': FOLDER_MIME,
                 'parents': [parent_id]
             }
-            file = self.service.files().create(body=file_metadata, fields='id').execute()
+            file = self.service.files().create(body=file_metadata, fields='id', supportsAllDrives=True).execute()
             folder_id = file.get('id')
-            self.folders_cache[cache_key] = folder_id
+            # Cache both lookup modes so the next prefix or exact search skips the API
+            self._cache_folder((parent_id, folder_name, False), folder_id)
+            self._cache_folder((parent_id, folder_name, True), folder_id)
             print(f"[CREATED] New folder: {folder_name}")
             return folder_id
             
@@ -257,11 +337,37 @@ class GoogleDriveService:
             print(f"[ERROR] Error creating nested folder structure: {e}")
             return None
 
-    async def upload_file_to_drive(self, file_data: bytes, filename: str, project_name: str, task_code: str = None, task_title: str = "") -> dict:
+    def resolve_target_folder(self, project_name: str, task_code: str = None, task_title: str = "") -> str:
+        """Folder ID an upload for this project/task goes to; resolve once and reuse for several files"""
+        if task_code:
+            # Use nested folder structure based on task code
+            return self.create_nested_task_folder(project_name, task_code, task_title)
+        # Fallback to project folder only
+        return self.find_or_create_folder(project_name)
+
+    @staticmethod
+    def _target_folder_path(project_name: str, task_code: str = None, task_title: str = "") -> str:
+        """Human-readable folder path for debug/return info"""
+        if not task_code:
+            return project_name
+        safe_title = "".join(x for x in task_title if (x.isalnum() or x in "._- ")) if task_title else ""
+        folder_suffix = f" {safe_title}" if safe_title else ""
+        return f"{project_name}/Element {task_code.split('.')[0]}/{task_code}{folder_suffix}"
+
+    async def upload_file_to_drive(self, file_data: Union[bytes, BinaryIO], filename: str, project_name: str, task_code: str = None, task_title: str = "", folder_id: str = None) -> dict:
         """Upload file to Google Drive folder with nested task folder structure.
         
+        Pass folder_id (from resolve_target_folder) to skip folder resolution.
+        Runs on the Drive worker pool so concurrent uploads don't block the event loop.
         Returns: dict with 'success', 'file_id', and 'folder_path' or None on failure
         """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor,
+            partial(self._upload_file_to_drive, file_data, filename, project_name, task_code, task_title, folder_id)
+        )
+
+    def _upload_file_to_drive(self, file_data: Union[bytes, BinaryIO], filename: str, project_name: str, task_code: str = None, task_title: str = "", folder_id: str = None) -> dict:
         if not self.enabled or not self.service:
             print("[WARN] Google Drive not enabled")
             return {"success": False, "file_id": None, "folder_path": None}
@@ -269,35 +375,32 @@ class GoogleDriveService:
         self._refresh_if_needed()
         
         try:
-            # Use nested folder structure based on task code
-            if task_code:
-                target_folder_id = self.create_nested_task_folder(project_name, task_code, task_title)
-                
-                # Format folder path for debug/return info
-                safe_title = "".join(x for x in task_title if (x.isalnum() or x in "._- ")) if task_title else ""
-                folder_suffix = f" {safe_title}" if safe_title else ""
-                folder_path = f"{project_name}/Element {task_code.split('.')[0]}/{task_code}{folder_suffix}"
-            else:
-                # Fallback to project folder only
-                target_folder_id = self.find_or_create_folder(project_name)
-                folder_path = project_name
+            target_folder_id = folder_id or self.resolve_target_folder(project_name, task_code, task_title)
+            folder_path = self._target_folder_path(project_name, task_code, task_title)
             
             if not target_folder_id:
                 print("[ERROR] Could not get target folder ID")
                 return {"success": False, "file_id": None, "folder_path": None}
 
+            # Skip the transfer if an identical file (same name and MD5) is already there
+            existing_id = self._find_identical_file(filename, target_folder_id, file_data)
+            if existing_id:
+                print(f"[SKIP] Identical file already in Drive: {folder_path}/{filename} (ID: {existing_id})")
+                return {"success": True, "file_id": existing_id, "folder_path": folder_path}
+
             # Upload File to that folder
             file_metadata = {
                 'name': filename,
                 'parents': [target_folder_id]
             }
             
-            media = MediaInMemoryUpload(file_data, resumable=True)
+            media = _in_memory_media(file_data)
             
             file = self.service.files().create(
                 body=file_metadata,
                 media_body=media,
-                fields='id'
+                fields='id',
+                supportsAllDrives=True
             ).execute()
             
             file_id = file.get('id')
@@ -308,6 +411,29 @@ class GoogleDriveService:
             print(f"[ERROR] Error uploading to Google Drive: {e}")
             return {"success": False, "file_id": None, "folder_path": None}
 
+    def _find_identical_file(self, filename: str, folder_id: str, file_data: Union[bytes, BinaryIO]) -> str:
+        """ID of a file with this name and content in folder_id, or None"""
+        # md5Checksum can't be used in a Drive query, so match by name and compare locally
+        query = _FILE_IN_FOLDER_QUERY.format(name=filename, parent=folder_id)
+        results = self.service.files().list(
+            q=query, spaces='drive', fields='files(id, md5Checksum)',
+            supportsAllDrives=True, includeItemsFromAllDrives=True
+        ).execute()
+        files = results.get('files', [])
+        if not files:
+            return None
+        if isinstance(file_data, bytes):
+            md5 = hashlib.md5(file_data, usedforsecurity=False).hexdigest()
+        else:
+            with file_data.getbuffer() as view:  # hash the BytesIO in place, no copy
+                md5 = hashlib.md5(view, usedforsecurity=False).hexdigest()
+        return next((f['id'] for f in files if f.get('md5Checksum') == md5), None)
+
+    async def upload_file_async(self, filename: str, file_content: bytes, folder_name: str = None) -> str:
+        """upload_file on the Drive worker pool, for async routes"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(self.upload_file, filename, file_content, folder_name))
+
     def upload_file(self, filename: str, file_content: bytes, folder_name: str = None) -> str:
         """Upload file to Google Drive and return file ID"""
         if not self.enabled or not self.service:
@@ -329,12 +455,13 @@ class GoogleDriveService:
                 'parents': [parent_id]
             }
             
-            media = MediaInMemoryUpload(file_content, resumable=True)
+            media = _in_memory_media(file_content)
             
             file = self.service.files().create(
                 body=file_metadata,
                 media_body=media,
-                fields='id'
+                fields='id',
+                supportsAllDrives=True
             ).execute()
             
             file_id = file.get('id')
@@ -358,7 +485,10 @@ class GoogleDriveService:
             
             # Search for file
             query = f"name='{filename}' and '{project_folder_id}' in parents and trashed=false"
-            results = self.service.files().list(q=query, spaces='drive', fields='files(id, name, mimeType)').execute()
+            results = self.service.files().list(
+                q=query, spaces='drive', fields='files(id)', pageSize=1,
+                supportsAllDrives=True, includeItemsFromAllDrives=True
+            ).execute()
             files = results.get('files', [])
             
             if files:
@@ -370,37 +500,49 @@ class GoogleDriveService:
             return None
     
     def _find_file_recursive(self, filename: str, folder_id: str, depth: int = 0) -> str:
-        """Recursively search for a file in folder and all subfolders"""
-        if depth > 5:  # Limit recursion depth
-            return None
-        
+        """Find a file anywhere under folder_id (up to 5 levels deep).
+
+        Uses one name query across Drive and checks each match's ancestry in memory,
+        instead of listing every subfolder level by level.
+        """
         try:
-            # First search in current folder
-            query = f"name='{filename}' and '{folder_id}' in parents and trashed=false and mimeType!='application/vnd.google-apps.folder'"
-            results = self.service.files().list(q=query, spaces='drive', fields='files(id, name)').execute()
-            files = results.get('files', [])
-            
-            if files:
-                print(f"[FOUND] File '{filename}' at depth {depth}")
-                return files[0]['id']
-            
-            # Get all subfolders
-            folder_query = f"'{folder_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false"
-            folder_results = self.service.files().list(q=folder_query, spaces='drive', fields='files(id, name)').execute()
-            subfolders = folder_results.get('files', [])
-            
-            # Search in each subfolder
-            for subfolder in subfolders:
-                file_id = self._find_file_recursive(filename, subfolder['id'], depth + 1)
-                if file_id:
-                    return file_id
-            
-            return None
+            query = _FILE_BY_NAME_QUERY.format(name=filename)
+            page_token = None
+            while True:
+                results = self.service.files().list(
+                    q=query, spaces='drive', fields='nextPageToken, files(id, name, parents)',
+                    pageSize=1000, pageToken=page_token,
+                    supportsAllDrives=True, includeItemsFromAllDrives=True
+                ).execute()
+                for f in results.get('files', []):
+                    level = self._descends_from(f.get('parents', []), folder_id, max_depth=6 - depth)
+                    if level is not None:
+                        print(f"[FOUND] File '{filename}' at depth {depth + level}")
+                        return f['id']
+                page_token = results.get('nextPageToken')
+                if not page_token:
+                    return None
             
         except Exception as e:
             print(f"[ERROR] Recursive search error: {e}")
             return None
     
+    def _descends_from(self, parents: list, ancestor_id: str, max_depth: int):
+        """Return how many folders below ancestor_id the parents list sits, or None"""
+        # Parent links already known from the folder cache save a files().get per level
+        known = {folder_id: key[0] for key, (folder_id, _) in list(self.folders_cache.items())}
+        level = 0
+        while parents and level < max_depth:
+            if ancestor_id in parents:
+                return level
+            parent_id = parents[0]
+            if parent_id in known:
+                parents = [known[parent_id]]
+            else:
+                parents = self.service.files().get(fileId=parent_id, fields='parents', supportsAllDrives=True).execute().get('parents', [])
+            level += 1
+        return None
+    
     def download_file(self, file_id: str) -> bytes:
         """Download a file from Google Drive by ID"""
         if not self.enabled or not self.service:
@@ -412,16 +554,15 @@ class GoogleDriveService:
             from googleapiclient.http import MediaIoBaseDownload
             import io
             
-            request = self.service.files().get_media(fileId=file_id)
+            request = self.service.files().get_media(fileId=file_id, supportsAllDrives=True)
             buffer = io.BytesIO()
-            downloader = MediaIoBaseDownload(buffer, request)
+            downloader = MediaIoBaseDownload(buffer, request, chunksize=DOWNLOAD_CHUNK_SIZE)
             
             done = False
             while not done:
                 status, done = downloader.next_chunk()
             
-            buffer.seek(0)
-            return buffer.read()
+            return buffer.getvalue()
             
         except Exception as e:
             print(f"[ERROR] Error downloading file: {e}")
@@ -437,9 +578,19 @@ class GoogleDriveService:
             if not project_folder_id:
                 return []
             
-            query = f"'{project_folder_id}' in parents and trashed=false and mimeType!='application/vnd.google-apps.folder'"
-            results = self.service.files().list(q=query, spaces='drive', fields='files(id, name, mimeType)').execute()
-            return results.get('files', [])
+            query = _FILES_IN_FOLDER_QUERY.format(parent=project_folder_id)
+            files = []
+            page_token = None
+            while True:
+                results = self.service.files().list(
+                    q=query, spaces='drive', fields='nextPageToken, files(id, name, mimeType)',
+                    pageSize=1000, pageToken=page_token,
+                    supportsAllDrives=True, includeItemsFromAllDrives=True
+                ).execute()
+                files.extend(results.get('files', []))
+                page_token = results.get('nextPageToken')
+                if not page_token:
+                    return files
             
         except Exception as e:
             print(f"[ERROR] Error listing files: {e}")
@@ -451,22 +602,11 @@ class GoogleDriveService:
             return None
         
         try:
-            request = self.service.files().export_media(
+            # Exports are capped at 10MB by Drive, so fetch the body in one request
+            return self.service.files().export_media(
                 fileId=file_id,
                 mimeType='application/pdf'
-            )
-            from googleapiclient.http import MediaIoBaseDownload
-            import io
-            
-            buffer = io.BytesIO()
-            downloader = MediaIoBaseDownload(buffer, request)
-            
-            done = False
-            while not done:
-                status, done = downloader.next_chunk()
-            
-            buffer.seek(0)
-            return buffer.read()
+            ).execute()
             
         except Exception as e:
             print(f"[ERROR] Error exporting file as PDF: {e}")
@@ -478,7 +618,7 @@ class GoogleDriveService:
             return None
         
         try:
-            file = self.service.files().get(fileId=file_id, fields='id, name, mimeType').execute()
+            file = self.service.files().get(fileId=file_id, fields='id, name, mimeType', supportsAllDrives=True).execute()
             return file
         except Exception as e:
             print(f"[ERROR] Error getting file info: {e}")
@@ -521,29 +661,18 @@ class GoogleDriveService:
             }
             copied_file = self.service.files().copy(
                 fileId=file_id,
-                body=copy_metadata
+                body=copy_metadata,
+                fields='id',
+                supportsAllDrives=True
             ).execute()
             temp_file_id = copied_file.get('id')
             print(f"[INFO] Created temp Google file: {temp_file_id}")
             
-            # Step 2: Export as PDF
-            from googleapiclient.http import MediaIoBaseDownload
-            import io
-            
-            request = self.service.files().export_media(
+            # Step 2: Export as PDF (single request, exports are capped at 10MB)
+            pdf_bytes = self.service.files().export_media(
                 fileId=temp_file_id,
                 mimeType='application/pdf'
-            )
-            
-            buffer = io.BytesIO()
-            downloader = MediaIoBaseDownload(buffer, request)
-            
-            done = False
-            while not done:
-                status, done = downloader.next_chunk()
-            
-            buffer.seek(0)
-            pdf_bytes = buffer.read()
+            ).execute()
             print(f"[OK] Converted {filename} to PDF ({len(pdf_bytes)} bytes)")
             
             return pdf_bytes
@@ -553,10 +682,14 @@ class GoogleDriveService:
             return None
             
         finally:
-            # Step 3: Delete the temporary file
+            # Step 3: Delete the temporary file before returning (a serverless invocation
+            # can be frozen once the response is out, which would leak the Google copy)
             if temp_file_id:
-                try:
-                    self.service.files().delete(fileId=temp_file_id).execute()
-                    print(f"[INFO] Deleted temp file: {temp_file_id}")
-                except Exception as e:
-                    print(f"[WARN] Could not delete temp file: {e}")
+                self._delete_temp_file(temp_file_id)
+
+    def _delete_temp_file(self, file_id: str):
+        try:
+            self.service.files().delete(fileId=file_id, supportsAllDrives=True).execute()
+            print(f"[INFO] Deleted temp file: {file_id}")
+        except Exception as e:
+            print(f"[WARN] Could not delete temp file: {e}")
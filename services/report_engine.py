@@ -1,13 +1,106 @@
 
 import csv
-import pdfplumber
+import hashlib
+import importlib.util
 import openpyxl
-# from docx import Document
-# from pptx import Presentation
+# PDF libraries are imported where they are used, so Excel/CSV-only requests
+# don't pay their import time on a cold start.
+# MuPDF C engine: much faster text/table extraction than pdfminer
+PYMUPDF_AVAILABLE = importlib.util.find_spec("pymupdf") is not None
 import io
 import os
 import re
-from typing import Dict, List, Any, Optional
+from itertools import chain, zip_longest
+from datetime import date
+from typing import Dict, Iterable, Iterator, List, Any, Optional, Sequence, Tuple, Union, BinaryIO
+
+# Text fallback in parse_pdf_source: training lines, their MM/DD/YYYY date and 4-digit ID.
+# Markers are one alternation matched per page, yielding only the lines that contain one.
+TRAINING_MARKERS = ('RightStart', 'WFRD CORE', 'GEOZONE')
+_TRAINING_LINE_RE = re.compile(r'^.*?(?:%s).*$' % '|'.join(map(re.escape, TRAINING_MARKERS)), re.MULTILINE)
+_DATE_RE = re.compile(r'\b(\d{1,2}/\d{1,2}/\d{2,4})\b')
+_TRAINING_ID_RE = re.compile(r'(?<!\S)\d{4}(?!\S)')
+_MDY_DATE_RE = re.compile(r'^(\d{1,2})[/\-](\d{1,2})[/\-](\d{2,4})$')
+
+def _fast_parse_date(value: Any) -> Any:
+    """MM/DD/YYYY (or MM-DD-YY) string -> date so template cells stay sortable; anything else is returned as-is"""
+    if not isinstance(value, str):
+        return value
+    match = _MDY_DATE_RE.match(value.strip())
+    if not match:
+        return value
+    month, day, year = (int(g) for g in match.groups())
+    if year < 100:
+        year += 2000
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return value
+
+def _classify_header(header_row: List[str]) -> Dict[str, Any]:
+    """One pass over a lower-cased PDF table header: first index of each column role"""
+    roles = {}
+    for i, h in enumerate(header_row):
+        if h == 'name':
+            roles.setdefault('name', i)
+        if h == 'compliance':
+            roles.setdefault('compliance', i)
+        if 'start' in h:
+            roles.setdefault('start', i)
+        if 'end' in h:
+            roles.setdefault('end', i)
+        if 'completion' in h:
+            roles.setdefault('completion', i)
+    return roles
+
+def _cell_date(row: list, idx: Optional[int]) -> Any:
+    return _fast_parse_date(row[idx]) if idx is not None and len(row) > idx else None
+
+# Source records: a list of dicts, or (headers, rows) columns; rows may be a lazy iterable
+Records = Union[List[Dict[str, Any]], Tuple[List[str], Iterable[Sequence[Any]]]]
+
+# Matrix template scans kept in memory (oldest evicted first)
+TEMPLATE_CACHE_SIZE = 8
+
+# Pages with fewer ruling objects than this skip pdfplumber's table finder
+MIN_TABLE_RULES = 2
+
+def _page_tables_and_text(page) -> Tuple[list, Optional[str]]:
+    """Both passes over one pdfplumber page, then drop its cached layout objects before the next page"""
+    try:
+        # The default "lines" strategy builds tables only from ruling lines, rects and curves;
+        # with fewer than MIN_TABLE_RULES of them no usable (2+ row) table can be found.
+        rules = len(page.lines) + len(page.rects) + len(page.curves)
+        tables = page.extract_tables() if rules >= MIN_TABLE_RULES else []
+        return tables, page.extract_text()
+    finally:
+        page.close()
+
+def _extract_with_pymupdf(file_content: bytes) -> List[Tuple[list, Optional[str]]]:
+    """(tables, text) per page via PyMuPDF; tables come back as rows of cell strings like pdfplumber's"""
+    import pymupdf
+    with pymupdf.open(stream=file_content, filetype="pdf") as doc:
+        return [
+            ([table.extract() for table in page.find_tables().tables], page.get_text("text"))
+            for page in doc
+        ]
+
+def _extract_pdf_pages(file_content: Union[bytes, BinaryIO]) -> List[Tuple[list, Optional[str]]]:
+    """(tables, text) per page: PyMuPDF when installed, else pdfplumber (imported and opened only then)"""
+    if not isinstance(file_content, bytes):
+        file_content.seek(0)
+        file_content = file_content.read()
+    
+    if PYMUPDF_AVAILABLE:
+        try:
+            # Table-less (text-only) PDFs are handled by parse_pdf_source's text fallback on MuPDF's page text
+            return _extract_with_pymupdf(file_content)
+        except Exception as e:
+            print(f"[ReportEngine] PyMuPDF extraction failed ({e}), using pdfplumber")
+    
+    import pdfplumber
+    with pdfplumber.open(io.BytesIO(file_content)) as pdf:
+        return [_page_tables_and_text(page) for page in pdf.pages]
 
 class ReportEngine:
     """
@@ -16,43 +109,83 @@ class ReportEngine:
     """
 
     def __init__(self):
-        pass
+        # Extension -> handler, resolved once per file in process_request
+        self._source_parsers = {
+            '.xlsx': self._parse_excel_entry,
+            '.xls': self._parse_excel_entry,
+            '.pdf': self._parse_pdf_entry,
+        }
+        self._template_fillers = {
+            '.docx': self._fill_docx,
+            '.xlsx': self._fill_xlsx,
+            '.csv': self._fill_csv,
+        }
+        # Template content hash -> _scan_matrix_template result
+        self._template_cache = {}
+
+    @staticmethod
+    def _excel_columns(rows, limit: Optional[int] = None) -> Tuple[List[str], List[tuple]]:
+        """Split an iter_rows(values_only=True) stream into (headers, value rows), skipping blank rows"""
+        header = next(rows, None) or ()
+        headers = [str(h).strip() if h else f"col_{i + 1}" for i, h in enumerate(header)]
+        width = len(headers)
+        
+        data = []
+        for row in rows:
+            values = row[:width]
+            if not any(values):
+                continue
+            data.append(values)
+            if limit and len(data) >= limit:
+                break
+        return headers, data
+
+    def parse_excel_columns(self, file_content: bytes) -> Tuple[List[str], List[tuple]]:
+        """
+        Parse an Excel source into (headers, rows) without building a dict per row
+        (read-only mode: rows are streamed, no Cell objects are kept)
+        """
+        try:
+            wb = openpyxl.load_workbook(io.BytesIO(file_content), read_only=True, data_only=True)
+            try:
+                return self._excel_columns(wb.active.iter_rows(values_only=True))
+            finally:
+                wb.close()
+        except Exception as e:
+            print(f"[ReportEngine] Error parsing Excel: {e}")
+            return [], []
 
     def parse_excel_source(self, file_content: bytes) -> List[Dict[str, Any]]:
         """
         Parse an Excel source file using openpyxl instead of pandas
         """
+        headers, rows = self.parse_excel_columns(file_content)
+        return [dict(zip(headers, values)) for values in rows]
+
+    def parse_excel_source_head(self, source: Union[bytes, BinaryIO], n: int = 5) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Build only the first n records of an Excel source (streaming, read-only mode).
+        Returns (records, total_records); the rest of the sheet is streamed just to count
+        the non-blank rows, so the total matches what parse_excel_source would return.
+        """
         try:
-            wb = openpyxl.load_workbook(io.BytesIO(file_content), data_only=True)
-            ws = wb.active
-            
-            data = []
-            headers = []
-            
-            # Get headers from first row
-            for cell in ws[1]:
-                headers.append(str(cell.value).strip() if cell.value else f"col_{cell.col_idx}")
-                
-            # Parse rows
-            for row in ws.iter_rows(min_row=2, values_only=True):
-                record = {}
-                has_data = False
-                for i, value in enumerate(row):
-                    if i < len(headers):
-                        record[headers[i]] = value
-                        if value: has_data = True
-                
-                if has_data:
-                    data.append(record)
-                    
-            return data
+            wb = openpyxl.load_workbook(io.BytesIO(source) if isinstance(source, bytes) else source,
+                                        read_only=True, data_only=True)
+            try:
+                rows = wb.active.iter_rows(values_only=True)
+                headers, head = self._excel_columns(rows, limit=n)
+                width = len(headers)
+                total_records = len(head) + sum(1 for row in rows if any(row[:width]))
+            finally:
+                wb.close()
+            return [dict(zip(headers, values)) for values in head], total_records
         except Exception as e:
-            print(f"[ReportEngine] Error parsing Excel: {e}")
-            return []
+            print(f"[ReportEngine] Error parsing Excel head: {e}")
+            return [], 0
 
-    def parse_pdf_source(self, file_content: bytes) -> Dict[str, Any]:
+    def parse_pdf_source(self, file_content: Union[bytes, BinaryIO]) -> Dict[str, Any]:
         """
-        Extract data from PDF using pdfplumber.
+        Extract data from PDF (PyMuPDF when installed, else pdfplumber).
         Returns a dictionary with 'employee_name' and 'records' list.
         Handles multiple table formats:
         1. Competency Role History table (Name, Start Date, End Date, Compliance)
@@ -64,100 +197,77 @@ class ReportEngine:
         }
         
         try:
-            with pdfplumber.open(io.BytesIO(file_content)) as pdf:
-                # 1. Try to extract Employee Name from first page text
-                first_page_text = pdf.pages[0].extract_text()
-                if first_page_text:
-                    lines = [l.strip() for l in first_page_text.split('\n') if l.strip()]
-                    if lines:
-                        data['employee_name'] = lines[0] 
-                        
-                # 2. Extract Tables from ALL pages
-                for page in pdf.pages:
-                    tables = page.extract_tables()
-                    for table in tables:
-                        if not table or len(table) < 2: continue
-                        
-                        # Get header row (clean up None values)
-                        header_row = [str(h).lower().replace('\n', ' ').strip() if h else '' for h in table[0]]
-                        
-                        # Check for Competency Role History table (has 'compliance')
-                        if 'name' in header_row and 'compliance' in header_row:
-                            try:
-                                name_idx = header_row.index('name')
-                                start_idx = next((i for i, h in enumerate(header_row) if 'start' in h), None)
-                                end_idx = next((i for i, h in enumerate(header_row) if 'end' in h), None)
-                                
-                                for row in table[1:]:
-                                    if len(row) <= name_idx or not row[name_idx]: continue
-                                    record = {
-                                        'Training Name': str(row[name_idx]).strip(),
-                                        'Start Date': row[start_idx] if start_idx is not None and len(row) > start_idx else None,
-                                        'End Date': row[end_idx] if end_idx is not None and len(row) > end_idx else None
-                                    }
-                                    if record['Training Name']:
-                                        data['records'].append(record)
-                            except (IndexError, ValueError):
-                                continue
+            # (tables, text) per page, extracted once in-process
+            page_data = _extract_pdf_pages(file_content)
+            
+            # 1. Try to extract Employee Name from first page text
+            first_page_text = page_data[0][1] if page_data else None
+            if first_page_text:
+                lines = [l.strip() for l in first_page_text.split('\n') if l.strip()]
+                if lines:
+                    data['employee_name'] = lines[0] 
+                    
+            # 2. Extract Tables from ALL pages
+            for tables, _ in page_data:
+                for table in tables:
+                    if not table or len(table) < 2: continue
+                    
+                    # Get header row (clean up None values)
+                    header_row = [str(h).lower().replace('\n', ' ').strip() if h else '' for h in table[0]]
+                    
+                    # Both table types need an exact "name" column; reject other tables before classifying
+                    if 'name' not in header_row: continue
+                    roles = _classify_header(header_row)
+                    
+                    if 'compliance' in roles:
+                        # Competency Role History table (has 'compliance')
+                        start_idx, end_idx = roles.get('start'), roles.get('end')
+                    elif 'completion' in roles:
+                        # Training table (has 'completion date'): completion date as training date, no expiry
+                        start_idx, end_idx = roles['completion'], None
+                    else:
+                        continue
+                    
+                    name_idx = roles['name']
+                    for row in table[1:]:
+                        if len(row) <= name_idx or not row[name_idx]: continue
+                        training_name = str(row[name_idx]).strip()
+                        if training_name:
+                            data['records'].append({
+                                'Training Name': training_name,
+                                'Start Date': _cell_date(row, start_idx),
+                                'End Date': _cell_date(row, end_idx)
+                            })
+            
+            # Also pick up free-text training lines (the "Training" section in page 2);
+            # names already taken from a table are skipped
+            seen_names = {r['Training Name'].lower() for r in data['records']}
+            for _, text in page_data:
+                if text and 'Training' in text:
+                    # Only lines matching the "RightStart - ..." pattern
+                    for line_match in _TRAINING_LINE_RE.finditer(text):
+                        line = line_match.group(0)
+                        # Try to parse: Name ID Type Pass% Date
+                        date_match = _DATE_RE.search(line)
+                        if not date_match:
+                            continue
+                        # Get training name (everything before the 4-digit ID number)
+                        id_match = _TRAINING_ID_RE.search(line)
+                        training_name = ' '.join(line[:id_match.start() if id_match else len(line)].split())
                         
-                        # Check for Training table (has 'completion date')
-                        elif 'name' in header_row and any('completion' in h for h in header_row):
-                            try:
-                                name_idx = header_row.index('name')
-                                completion_idx = next((i for i, h in enumerate(header_row) if 'completion' in h), None)
-                                
-                                for row in table[1:]:
-                                    if len(row) <= name_idx or not row[name_idx]: continue
-                                    training_name = str(row[name_idx]).strip()
-                                    completion_date = row[completion_idx] if completion_idx is not None and len(row) > completion_idx else None
-                                    
-                                    record = {
-                                        'Training Name': training_name,
-                                        'Start Date': completion_date,  # Use completion date as training date
-                                        'End Date': None  # No expiry in this table
-                                    }
-                                    if record['Training Name']:
-                                        data['records'].append(record)
-                            except (IndexError, ValueError):
-                                continue
-                
-                # Also try to extract from page text if tables didn't work well
-                # Look for "Training" section in page 2
-                for page in pdf.pages:
-                    text = page.extract_text()
-                    if text and 'Training' in text:
-                        lines = text.split('\n')
-                        for line in lines:
-                            # Look for lines matching "RightStart - ..." pattern
-                            if 'RightStart' in line or 'WFRD CORE' in line or 'GEOZONE' in line:
-                                # Try to parse: Name ID Type Pass% Date
-                                parts = line.split()
-                                # Find date pattern (MM/DD/YYYY)
-                                date_match = None
-                                for part in parts:
-                                    if '/' in part and len(part) >= 8:
-                                        date_match = part
-                                        break
-                                if date_match:
-                                    # Get training name (everything before the ID number)
-                                    name_parts = []
-                                    for part in parts:
-                                        if part.isdigit() and len(part) == 4:
-                                            break
-                                        name_parts.append(part)
-                                    training_name = ' '.join(name_parts)
-                                    
-                                    # Check if we already have this record
-                                    existing = [r for r in data['records'] if r['Training Name'].lower() == training_name.lower()]
-                                    if not existing and training_name:
-                                        data['records'].append({
-                                            'Training Name': training_name,
-                                            'Start Date': date_match,
-                                            'End Date': None
-                                        })
-                
-                print(f"[ReportEngine] Parsed {len(data['records'])} training records for {data['employee_name']}")
-                
+                        # Check if we already have this record
+                        key = training_name.lower()
+                        if not training_name or key in seen_names:
+                            continue
+                        seen_names.add(key)
+                        data['records'].append({
+                            'Training Name': training_name,
+                            'Start Date': _fast_parse_date(date_match.group(1)),
+                            'End Date': None
+                        })
+            
+            print(f"[ReportEngine] Parsed {len(data['records'])} training records for {data['employee_name']}")
+            
             return data
         except Exception as e:
             print(f"[ReportEngine] PDF Parse Error: {e}")
@@ -165,28 +275,37 @@ class ReportEngine:
             traceback.print_exc()
             return data
 
-    def fill_matrix_template(self, template_content: bytes, source_data_list: List[Dict[str, Any]]) -> bytes:
+    def _scan_matrix_template(self, template_content: bytes) -> Tuple[Dict[str, Dict[str, int]], Dict[str, int], set]:
         """
-        Specialized filler for Training Matrix - Handles MULTIPLE Employees.
+        Read-only scan of a matrix template: (normalized header -> columns, employee name -> row,
+        blank training cells). Cached by content hash, since the same template is reused across batches.
         """
+        cache_key = hashlib.blake2b(template_content, digest_size=16).digest()
+        cached = self._template_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        header_row = 2
+        name_col_idx = 3
+        
+        # Read-only scan: header map, employee rows and empty training cells (no Cell objects)
+        training_map = {}
+        name_index = {}
+        empty_cells = set()
+        scan_wb = openpyxl.load_workbook(io.BytesIO(template_content), read_only=True)
         try:
-            wb = openpyxl.load_workbook(io.BytesIO(template_content))
-            ws = wb.active
+            rows = scan_wb.active.iter_rows(min_row=header_row, values_only=True)
+            header_vals = next(rows, ())
+            sub_vals = next(rows, ())
             
-            # 1. Map Headers (Do this once)
-            training_map = {}
-            header_row = 2
-            sub_header_row = 3
+            # Map Headers (Do this once)
             current_training = None
-            
-            for col in range(1, ws.max_column + 1):
-                val = ws.cell(row=header_row, column=col).value
+            for col, (val, sub_val) in enumerate(zip_longest(header_vals, sub_vals), start=1):
                 if val:
                     current_training = str(val).strip()
                     if current_training not in training_map:
                         training_map[current_training] = {}
                 
-                sub_val = ws.cell(row=sub_header_row, column=col).value
                 if current_training and sub_val:
                     sub_val_str = str(sub_val).strip().lower()
                     if 'training date' == sub_val_str:
@@ -194,9 +313,50 @@ class ReportEngine:
                     elif 'expiry' in sub_val_str:
                          training_map[current_training]['expiry_col'] = col
 
-            print(f"[ReportEngine] Processing {len(source_data_list)} employees for Matrix...")
+            cols_to_check = sorted(
+                {cols['date_col'] for cols in training_map.values() if 'date_col' in cols} |
+                {cols['expiry_col'] for cols in training_map.values() if 'expiry_col' in cols}
+            )
+            
+            # Employee name (lower-cased) -> row, plus the blank training cells of named rows
+            for row_idx, row in enumerate(rows, start=header_row + 2):
+                name = row[name_col_idx - 1] if len(row) >= name_col_idx else None
+                if not name:
+                    continue
+                name_index.setdefault(str(name).strip().lower(), row_idx)
+                for col in cols_to_check:
+                    value = row[col - 1] if len(row) >= col else None
+                    if value is None or str(value).strip() == '':
+                        empty_cells.add((row_idx, col))
+        finally:
+            scan_wb.close()
+
+        # Normalized header -> columns, so record names match by dict lookup first
+        training_map_norm = {}
+        for h, cols in training_map.items():
+            training_map_norm.setdefault(h.lower().strip(), cols)
+        
+        result = (training_map_norm, name_index, empty_cells)
+        if len(self._template_cache) >= TEMPLATE_CACHE_SIZE:
+            self._template_cache.pop(next(iter(self._template_cache), None), None)
+        self._template_cache[cache_key] = result
+        return result
 
-            # 2. Iterate through EACH employee source
+    def fill_matrix_template(self, template_content: bytes, source_data_list: List[Dict[str, Any]]) -> bytes:
+        """
+        Specialized filler for Training Matrix - Handles MULTIPLE Employees.
+        The template is scanned once in read-only mode; only the target cells are written afterwards.
+        """
+        try:
+            # 1. Template layout (read-only scan, cached per template)
+            training_map_norm, name_index, empty_cells = self._scan_matrix_template(template_content)
+            # PDF training name (normalized) -> matched columns; names repeat across employees
+            match_cache = {}
+
+            # 2. Iterate through EACH employee source, collecting (row, col) -> value writes
+            # (one summary line is printed afterwards instead of a line per employee)
+            writes = {}
+            matched, not_found = 0, []
             for source_data in source_data_list:
                 employee_name = source_data.get('employee_name')
                 records = source_data.get('records', [])
@@ -204,20 +364,18 @@ class ReportEngine:
                 if not employee_name:
                     continue
                     
-                print(f"  -> Employee: {employee_name}")
-                
                 # Find Employee Row
-                emp_row_idx = None
-                name_col_idx = 3 
-                for row in ws.iter_rows(min_row=4, max_col=5):
-                    cell_val = row[name_col_idx-1].value
-                    if cell_val and (str(employee_name).lower() in str(cell_val).lower() or str(cell_val).lower() in str(employee_name).lower()):
-                        emp_row_idx = row[0].row
-                        break
+                employee_lower = str(employee_name).strip().lower()
+                emp_row_idx = name_index.get(employee_lower)
+                if not emp_row_idx:
+                    # Partial match either way, e.g. "Bob" vs "Bob Jones"
+                    emp_row_idx = next((r for name, r in name_index.items()
+                                        if employee_lower in name or name in employee_lower), None)
                 
                 if not emp_row_idx:
-                    print(f"     [!] Row not found in Excel.")
+                    not_found.append(employee_name)
                     continue
+                matched += 1
 
                 # Fill Data
                 for record in records:
@@ -230,70 +388,95 @@ class ReportEngine:
                     # Normalize training name from PDF
                     t_name_clean = t_name.lower().strip()
 
-                    matched = False
-                    for header, cols in training_map.items():
-                        header_clean = header.lower().strip()
-                        
-                        # Exact match (case-insensitive)
-                        if t_name_clean == header_clean:
-                            matched = True
-                        # Also match if PDF training contains the template header exactly
-                        elif header_clean in t_name_clean:
-                            matched = True
-                        
-                        if matched:
-                            if 'date_col' in cols and t_start:
-                                ws.cell(row=emp_row_idx, column=cols['date_col']).value = t_start
-                            if 'expiry_col' in cols and t_end:
-                                ws.cell(row=emp_row_idx, column=cols['expiry_col']).value = t_end
-                            break
+                    # Exact match (case-insensitive), else the first template header
+                    # contained in the PDF training name
+                    if t_name_clean in match_cache:
+                        cols = match_cache[t_name_clean]
+                    else:
+                        cols = training_map_norm.get(t_name_clean)
+                        if cols is None:
+                            cols = next((c for h, c in training_map_norm.items() if h in t_name_clean), None)
+                        match_cache[t_name_clean] = cols
+                    
+                    if cols is not None:
+                        if 'date_col' in cols and t_start:
+                            writes[(emp_row_idx, cols['date_col'])] = t_start
+                        if 'expiry_col' in cols and t_end:
+                            writes[(emp_row_idx, cols['expiry_col'])] = t_end
             
-            # 3. Fill empty cells with "N/A"
-            for row_idx in range(4, ws.max_row + 1):
-                emp_name = ws.cell(row=row_idx, column=3).value
-                if not emp_name: continue
-                
-                for header, cols in training_map.items():
-                    if 'date_col' in cols:
-                        cell = ws.cell(row=row_idx, column=cols['date_col'])
-                        if cell.value is None or str(cell.value).strip() == '':
-                            cell.value = 'N/A'
-                    if 'expiry_col' in cols:
-                        cell = ws.cell(row=row_idx, column=cols['expiry_col'])
-                        if cell.value is None or str(cell.value).strip() == '':
-                            cell.value = 'N/A'
+            print(f"[ReportEngine] Matrix: {matched} of {len(source_data_list)} employees matched"
+                  + (f", row not found for: {', '.join(map(str, not_found))}" if not_found else ""))
+
+            # 3. Fill cells still empty with "N/A" (writes all land in named rows' training columns)
+            for cell_key in empty_cells.union(writes):
+                if str(writes.get(cell_key, '')).strip() == '':
+                    writes[cell_key] = 'N/A'
+
+            if not writes:
+                return template_content
+
+            # 4. Full load only to apply the collected writes
+            wb = openpyxl.load_workbook(io.BytesIO(template_content))
+            ws = wb.active
+            for (row_idx, col), value in writes.items():
+                ws.cell(row=row_idx, column=col, value=value)
 
             output = io.BytesIO()
             wb.save(output)
-            output.seek(0)
-            return output.read()
+            return output.getvalue()
             
         except Exception as e:
             print(f"[ReportEngine] Matrix Fill Error: {e}")
             return template_content
 
-    def fill_csv_template(self, data_records: List[Dict[str, Any]]) -> bytes:
+    @staticmethod
+    def _record_headers(data: Records) -> List[str]:
+        """Column names: the first record's keys, then any other keys in order of appearance"""
+        if isinstance(data, tuple):
+            return list(data[0])
+        return list(dict.fromkeys(key for record in data for key in record))
+
+    @staticmethod
+    def _record_rows(data: Records, headers: List[str]) -> Iterator[Sequence[Any]]:
+        """Lazily yield value rows in `headers` order, from dict records or (headers, rows) columns"""
+        if isinstance(data, tuple):
+            src_headers, rows = data
+            if list(src_headers) == list(headers):
+                return iter(rows)
+            index = {h: i for i, h in enumerate(src_headers)}
+            picks = [index.get(h) for h in headers]
+            return ([row[i] if i is not None and i < len(row) else '' for i in picks] for row in rows)
+        return ([record.get(h, '') for h in headers] for record in data)
+
+    def fill_csv_template(self, data_records: Records) -> bytes:
         """
-        Generate a CSV from data records using csv module (removed pandas)
+        Generate a CSV from data records using csv module (removed pandas).
+        data_records is a list of dicts or (headers, rows) columns from parse_excel_columns.
         """
         try:
-            if not data_records:
+            headers = self._record_headers(data_records)
+            rows = self._record_rows(data_records, headers)
+            first = next(rows, None)
+            if first is None:
                 return b"No data found"
                 
-            output = io.StringIO()
-            if data_records:
-                headers = data_records[0].keys()
-                writer = csv.DictWriter(output, fieldnames=headers)
-                writer.writeheader()
-                writer.writerows(data_records)
+            # Encode straight into the byte buffer instead of building a str and encoding a copy
+            output = io.BytesIO()
+            text = io.TextIOWrapper(output, encoding='utf-8', newline='', write_through=True)
+            writer = csv.writer(text)
+            writer.writerow(headers)
+            writer.writerow(first)
+            writer.writerows(rows)
+            text.flush()
+            text.detach()  # keep the wrapper from closing the buffer
                 
-            return output.getvalue().encode('utf-8')
+            return output.getvalue()
         except Exception as e:
             print(f"[ReportEngine] Error generating CSV: {e}")
             return b"Error generating CSV"
 
 
-    def fill_excel_template(self, template_content: bytes, data_records: List[Dict[str, Any]]) -> bytes:
+    def fill_excel_template(self, template_content: bytes, data_records: Records) -> bytes:
         """
         Fill a flexible Excel template by appending rows
         """
@@ -307,24 +490,55 @@ class ReportEngine:
                 headers = [str(cell.value) for cell in ws[1] if cell.value]
             
             # If no headers in template, use keys from first record
-            if not headers and data_records:
-                headers = list(data_records[0].keys())
-                ws.append(headers)
+            if not headers:
+                headers = self._record_headers(data_records)
+                if headers:
+                    ws.append(headers)
             
-            for record in data_records:
-                row = []
-                for h in headers:
-                    row.append(record.get(h, ''))
+            for row in self._record_rows(data_records, headers):
                 ws.append(row)
                 
             output = io.BytesIO()
             wb.save(output)
-            output.seek(0)
-            return output.read()
+            return output.getvalue()
         except Exception as e:
             print(f"[ReportEngine] Excel Fill Error: {e}")
             return template_content
 
+    @staticmethod
+    def _iter_records(all_source_data: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        for d in all_source_data:
+            if 'columns' in d:
+                headers, rows = d['columns']
+                yield from (dict(zip(headers, values)) for values in rows)
+            elif isinstance(d.get('records'), list):
+                yield from d['records']
+
+    @classmethod
+    def _concat_records(cls, all_source_data: List[Dict[str, Any]]) -> Records:
+        """
+        Chain the records of all sources into one lazy (headers, rows) stream for the writers.
+        Excel sources sharing the same headers are chained as-is; otherwise the headers are the union
+        of every source's columns, in order of appearance.
+        """
+        columns = [d['columns'] for d in all_source_data if 'columns' in d]
+        if columns and len(columns) == len(all_source_data):
+            headers = columns[0][0]
+            if len(set(headers)) == len(headers) and all(h == headers for h, _ in columns):
+                return headers, chain.from_iterable(rows for _, rows in columns)
+        
+        headers = {}
+        for d in all_source_data:
+            if 'columns' in d:
+                if d['columns'][1]:
+                    headers.update(dict.fromkeys(d['columns'][0]))
+            elif isinstance(d.get('records'), list):
+                headers.update(dict.fromkeys(key for record in d['records'] for key in record))
+        if not headers:
+            return []
+        headers = list(headers)
+        return headers, ([record.get(h, '') for h in headers] for record in cls._iter_records(all_source_data))
+
     def process_request(self, template_content: bytes, template_filename: str, source_contents: List[bytes], source_filenames: List[str]) -> bytes:
         """
         Main entry point. Handles multiple sources.
@@ -333,16 +547,9 @@ class ReportEngine:
         all_source_data = []
         
         for content, filename in zip(source_contents, source_filenames):
-            if filename.lower().endswith('.xlsx') or filename.lower().endswith('.xls'):
-                data = self.parse_excel_source(content)
-                if isinstance(data, list):
-                    all_source_data.append({'records': data, 'filename': filename})
-                else:
-                    all_source_data.append(data)
-                    
-            elif filename.lower().endswith('.pdf'):
-                data = self.parse_pdf_source(content)
-                all_source_data.append(data)
+            parser = self._source_parsers.get(os.path.splitext(filename)[1].lower())
+            if parser:
+                all_source_data.append(parser(content, filename))
             else:
                 print(f"[ReportEngine] Skip unsupported: {filename}")
 
@@ -351,42 +558,30 @@ class ReportEngine:
             return None
 
         # 2. Fill Template
-        generated_file = None
-        
-        # Matrix Check
-        is_matrix = False
-        if template_filename.lower().endswith('.xlsx'):
-            if any(d.get('employee_name') for d in all_source_data if isinstance(d, dict)):
-                is_matrix = True
-
-        if template_filename.lower().endswith('.docx'):
-            # Stub for docx (would need python-docx code here if used)
-            print("[ReportEngine] DOCX not fully implemented in lightweight version")
+        filler = self._template_fillers.get(os.path.splitext(template_filename)[1].lower())
+        if not filler:
+            print(f"[ReportEngine] Unsupported template: {template_filename}")
             return None
             
-        elif template_filename.lower().endswith('.xlsx'):
-            if is_matrix:
-                generated_file = self.fill_matrix_template(template_content, all_source_data)
-            else:
-                # Concatenate all records
-                all_records = []
-                for d in all_source_data:
-                    recs = d.get('records', []) if isinstance(d, dict) else d
-                    if isinstance(recs, list):
-                         all_records.extend(recs)
-                generated_file = self.fill_excel_template(template_content, all_records)
-        
-        elif template_filename.lower().endswith('.csv'):
-             # Concatenate
-            all_records = []
-            for d in all_source_data:
-                recs = d.get('records', []) if isinstance(d, dict) else d
-                if isinstance(recs, list):
-                    all_records.extend(recs)
-            generated_file = self.fill_csv_template(all_records)
-        
-        else:
-             print(f"[ReportEngine] Unsupported template: {template_filename}")
-             return None
-             
-        return generated_file
+        return filler(template_content, all_source_data)
+
+    def _parse_excel_entry(self, content: bytes, filename: str) -> Dict[str, Any]:
+        # Keep Excel rows columnar; dicts are only built if another source needs them
+        return {'columns': self.parse_excel_columns(content), 'filename': filename}
+
+    def _parse_pdf_entry(self, content: bytes, filename: str) -> Dict[str, Any]:
+        return self.parse_pdf_source(content)
+
+    def _fill_docx(self, template_content: bytes, all_source_data: List[Dict[str, Any]]) -> Optional[bytes]:
+        # Stub for docx (would need python-docx code here if used)
+        print("[ReportEngine] DOCX not fully implemented in lightweight version")
+        return None
+
+    def _fill_xlsx(self, template_content: bytes, all_source_data: List[Dict[str, Any]]) -> bytes:
+        # Matrix Check
+        if any(d.get('employee_name') for d in all_source_data if isinstance(d, dict)):
+            return self.fill_matrix_template(template_content, all_source_data)
+        return self.fill_excel_template(template_content, self._concat_records(all_source_data))
+
+    def _fill_csv(self, template_content: bytes, all_source_data: List[Dict[str, Any]]) -> bytes:
+        return self.fill_csv_template(self._concat_records(all_source_data))
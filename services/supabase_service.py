@@ -3,23 +3,98 @@ Supabase Database Service
 Provides persistent storage for CSMS application data
 """
 import os
+import atexit
+import queue
+import random
+import base64
+import logging
+import threading
+import time
+import binascii
 from typing import List, Dict, Optional
-from datetime import datetime
+from datetime import datetime, timezone
 import json
+from concurrent.futures import Future
 
 try:
     from supabase import create_client, Client
+    from postgrest.types import ReturnMethod
     SUPABASE_AVAILABLE = True
 except ImportError:
     SUPABASE_AVAILABLE = False
     print("[WARN] supabase-py not installed. Run: pip install supabase")
 
+try:
+    import orjson  # C JSON codec for legacy string-encoded attachments/replies
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import httpx
+    from supabase import ClientOptions
+    POOL_CONFIG_AVAILABLE = True
+except ImportError:
+    POOL_CONFIG_AVAILABLE = False
+
+log = logging.getLogger("csms.supabase")
+
+# Connection pool sizing for the shared PostgREST HTTP client
+SUPABASE_MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "60"))
+SUPABASE_MAX_KEEPALIVE = int(os.getenv("SUPABASE_MAX_KEEPALIVE", "40"))
+
+# Transient transport failures (dropped streams, timeouts, resets) are retried with jittered backoff
+SUPABASE_MAX_RETRIES = max(1, int(os.getenv("SUPABASE_MAX_RETRIES", "3")))
+SUPABASE_RETRY_BASE_DELAY = float(os.getenv("SUPABASE_RETRY_BASE_DELAY", "0.1"))
+SUPABASE_RETRY_MAX_DELAY = float(os.getenv("SUPABASE_RETRY_MAX_DELAY", "2.0"))
+
+# app_logs rows are queued and inserted in batches by a background flusher. Off on
+# Vercel (serverless invocations can be frozen after the response, losing the queue)
+LOG_BATCHING = os.getenv("SUPABASE_LOG_BATCHING", "0" if os.getenv("VERCEL") else "1") == "1"
+LOG_QUEUE_SIZE = 10000
+LOG_BATCH_SIZE = 200
+LOG_FLUSH_INTERVAL = 1.0
+
+# Public Storage bucket holding comment/reply images (instead of base64 in the row)
+COMMENT_ATTACHMENT_BUCKET = os.getenv("SUPABASE_COMMENT_BUCKET", "comment-attachments")
+
+# Tables batch_upsert may write to (the name ends up in the request path)
+UPSERT_TABLES = frozenset({'projects', 'tasks', 'schedules', 'comments', 'csms_pb', 'related_docs'})
+
+# Read-mostly tables (projects, schedules, related_docs) are served from memory this long
+READ_CACHE_TTL = float(os.getenv("SUPABASE_READ_CACHE_TTL", "10"))
+
+_json_loads = orjson.loads if ORJSON_AVAILABLE else json.loads
+
+def _decode_json_field(rows: List[Dict], field: str) -> List[Dict]:
+    """
+    attachments/replies are JSONB and written as native lists; rows saved before that
+    hold a JSON-encoded string instead, which is parsed in place ([] if it does not parse)
+    """
+    # Nearly every row is already a list, so pick out the legacy strings in one pass first
+    legacy = [row for row in rows if type(row.get(field)) is str]
+    loads = _json_loads
+    for row in legacy:
+        try:
+            row[field] = loads(row[field])
+        except ValueError:
+            row[field] = []
+    return rows
+
 class SupabaseService:
     def __init__(self):
         self.url = os.getenv("SUPABASE_URL", "")
         self.key = os.getenv("SUPABASE_KEY", "")
         self.client: Optional[Client] = None
         self.enabled = False
+        self._read_cache = {}  # table -> (rows, expires_at)
+        self._read_inflight = {}  # table -> Future of the one select currently running for it
+        self._read_generation = {}  # table -> bumped on every write, so a select racing a write isn't cached
+        self._read_cache_lock = threading.Lock()
+        self._log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        self._log_flusher_thread = None
+        self._log_flusher_lock = threading.Lock()
+        self.dropped_log_events = 0
         
         print("[SUPABASE] Initializing Supabase Service...")
         print(f"  [DEBUG] SUPABASE_URL: {self.url[:30] + '...' if self.url else 'NOT SET'}")
@@ -34,44 +109,140 @@ class SupabaseService:
             return
         
         try:
-            self.client = create_client(self.url, self.key)
+            self.client = create_client(self.url, self.key, **self._client_kwargs())
             self.enabled = True
             print("[OK] Supabase client initialized!")
         except Exception as e:
             print(f"[ERROR] Supabase initialization failed: {e}")
             self.enabled = False
     
+    def _client_kwargs(self) -> Dict:
+        """Build a bounded, HTTP/2 keep-alive pool instead of httpx defaults"""
+        if not POOL_CONFIG_AVAILABLE:
+            return {}
+        try:
+            http_client = httpx.Client(
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=SUPABASE_MAX_CONNECTIONS,
+                    max_keepalive_connections=SUPABASE_MAX_KEEPALIVE
+                ),
+                timeout=httpx.Timeout(10.0, connect=3.0)
+            )
+            print(f"  [DEBUG] Pool: max_connections={SUPABASE_MAX_CONNECTIONS}, max_keepalive={SUPABASE_MAX_KEEPALIVE}")
+            return {"options": ClientOptions(httpx_client=http_client)}
+        except Exception as e:
+            # Older supabase-py / missing h2: fall back to the library defaults
+            print(f"[WARN] Could not configure Supabase connection pool: {e}")
+            return {}
+
+    @staticmethod
+    def _retryable(query, error: Exception) -> bool:
+        """
+        Reads retry any transport error. Writes (insert/update/upsert/delete) only retry errors
+        raised before the request went out, since a timeout or dropped stream after sending may
+        already have committed the write.
+        """
+        if not POOL_CONFIG_AVAILABLE or not isinstance(error, httpx.TransportError):
+            return False
+        # postgrest-py 2.x keeps the method on query.request, older versions on the builder
+        method = getattr(getattr(query, 'request', query), 'http_method', None)
+        if method in ('GET', 'HEAD'):
+            return True
+        return isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+
+    def _execute(self, query):
+        """Execute a PostgREST query, retrying transient transport errors with exponential backoff + jitter"""
+        for attempt in range(SUPABASE_MAX_RETRIES):
+            try:
+                return query.execute()
+            except Exception as e:
+                if attempt == SUPABASE_MAX_RETRIES - 1 or not self._retryable(query, e):
+                    raise
+                delay = min(SUPABASE_RETRY_BASE_DELAY * 2 ** attempt, SUPABASE_RETRY_MAX_DELAY)
+                delay += random.random() * SUPABASE_RETRY_BASE_DELAY
+                print(f"[WARN] Supabase request failed ({type(e).__name__}), retry {attempt + 1} in {delay:.2f}s: {e}")
+                time.sleep(delay)
+
+    def _cached_select(self, table: str, label: str) -> List[Dict]:
+        """
+        select * on a read-mostly table, reusing the last result for READ_CACHE_TTL seconds.
+        Concurrent misses on the same table wait for the one select already in flight.
+        """
+        with self._read_cache_lock:
+            cached = self._read_cache.get(table)
+            if cached and cached[1] > time.monotonic():
+                return list(cached[0])
+            future = self._read_inflight.get(table)
+            leader = future is None
+            if leader:
+                future = self._read_inflight[table] = Future()
+                generation = self._read_generation.get(table, 0)
+        if not leader:
+            return list(future.result())
+
+        rows = []
+        try:
+            result = self._execute(self.client.table(table).select("*"))
+            rows = result.data or []
+            with self._read_cache_lock:
+                if self._read_generation.get(table, 0) == generation:
+                    self._read_cache[table] = (rows, time.monotonic() + READ_CACHE_TTL)
+        except Exception as e:
+            print(f"[ERROR] Error fetching {label}: {e}")
+        finally:
+            with self._read_cache_lock:
+                self._read_inflight.pop(table, None)
+            future.set_result(rows)
+        return list(rows)
+
+    def _invalidate(self, table: str):
+        with self._read_cache_lock:
+            self._read_cache.pop(table, None)
+            self._read_generation[table] = self._read_generation.get(table, 0) + 1
+
     # ==================== PROJECTS ====================
     
     def get_projects(self) -> List[Dict]:
+        if not self.enabled:
+            return []
+        return self._cached_select('projects', 'projects')
+    
+    def get_projects_needing_reminder(self, start: str, end: str) -> List[Dict]:
+        """Projects with a PIC email whose rig down falls in [start, end] (ISO dates)"""
         if not self.enabled:
             return []
         try:
-            result = self.client.table('projects').select("*").execute()
+            query = (self.client.table('projects').select("*")
+                     .gte('rig_down', start).lte('rig_down', end)
+                     .not_.is_('pic_email', 'null')
+                     .neq('pic_email', ''))
+            result = self._execute(query)
             return result.data or []
         except Exception as e:
-            print(f"[ERROR] Error fetching projects: {e}")
+            print(f"[ERROR] Error fetching projects needing reminder: {e}")
             return []
     
     def get_project(self, project_id: str) -> Optional[Dict]:
         if not self.enabled:
             return None
         try:
-            result = self.client.table('projects').select("*").eq('id', project_id).execute()
+            result = self._execute(self.client.table('projects').select("*").eq('id', project_id))
             return result.data[0] if result.data else None
         except Exception as e:
             print(f"[ERROR] Error fetching project {project_id}: {e}")
             return None
     
     def create_project(self, project_data: Dict) -> Dict:
-        print(f"[SUPABASE] create_project called, enabled={self.enabled}")
-        print(f"[SUPABASE] Project data: {project_data}")
+        log.debug("create_project called, enabled=%s", self.enabled)
+        log.debug("Project data: %s", project_data)
         if not self.enabled:
-            print("[SUPABASE] Not enabled, returning data as-is")
+            log.debug("Not enabled, returning data as-is")
             return project_data
         try:
-            print(f"[SUPABASE] Attempting insert into 'projects'...")
-            response = self.client.table('projects').insert(project_data).execute()
+            log.debug("Attempting insert into 'projects'...")
+            response = self._execute(self.client.table('projects').insert(project_data))
+            self._invalidate('projects')
             
             # Check for error in response (some versions of supabase-py return it)
             if hasattr(response, 'error') and response.error:
@@ -79,22 +250,22 @@ class SupabaseService:
                 return project_data
                 
             if response.data:
-                print(f"[SUPABASE] SUCCESS! Project created: {response.data[0]['id']}")
+                log.debug("Project created: %s", response.data[0]['id'])
                 return response.data[0]
             else:
-                print(f"[SUPABASE] WARNING: No data returned from insert. Response: {response}")
+                log.warning("No data returned from project insert. Response: %s", response)
                 return project_data
         except Exception as e:
             print(f"[SUPABASE CRITICAL ERROR] Exception during insert: {type(e).__name__}: {e}")
-            import traceback
-            traceback.print_exc()
+            log.exception("Project insert failed")
             return project_data
     
     def update_project(self, project_id: str, updates: Dict) -> Optional[Dict]:
         if not self.enabled:
             return None
         try:
-            result = self.client.table('projects').update(updates).eq('id', project_id).execute()
+            result = self._execute(self.client.table('projects').update(updates).eq('id', project_id))
+            self._invalidate('projects')
             return result.data[0] if result.data else None
         except Exception as e:
             print(f"[ERROR] Error updating project: {e}")
@@ -104,7 +275,8 @@ class SupabaseService:
         if not self.enabled:
             return False
         try:
-            self.client.table('projects').delete().eq('id', project_id).execute()
+            self._execute(self.client.table('projects').delete().eq('id', project_id))
+            self._invalidate('projects')
             return True
         except Exception as e:
             print(f"[ERROR] Error deleting project: {e}")
@@ -112,95 +284,115 @@ class SupabaseService:
     
     # ==================== TASKS ====================
     
-    def get_tasks(self, project_id: str = None) -> List[Dict]:
+    def get_task_statuses(self, project_ids: List[str]) -> List[Dict]:
+        """Slim task rows (project_id, code, title, status) for the given projects"""
+        if not self.enabled or not project_ids:
+            return []
+        try:
+            query = self.client.table('tasks').select("project_id,code,title,status").in_('project_id', project_ids)
+            result = self._execute(query)
+            return result.data or []
+        except Exception as e:
+            print(f"[ERROR] Error fetching task statuses: {e}")
+            return []
+    
+    def get_task(self, task_id: str) -> Optional[Dict]:
+        if not self.enabled:
+            return None
+        try:
+            result = self._execute(self.client.table('tasks').select("*").eq('id', task_id))
+            return _decode_json_field(result.data[:1], 'attachments')[0] if result.data else None
+        except Exception as e:
+            print(f"[ERROR] Error fetching task {task_id}: {e}")
+            return None
+    
+    def get_tasks(self, project_id: str = None, columns: str = "*",
+                  limit: Optional[int] = None, offset: int = 0, status: str = None) -> List[Dict]:
         if not self.enabled:
             return []
         try:
-            query = self.client.table('tasks').select("*")
+            query = self.client.table('tasks').select(columns)
             if project_id:
                 query = query.eq('project_id', project_id)
-            result = query.execute()
-            tasks = result.data or []
+            if status:
+                query = query.eq('status', status)
+            if limit is not None:
+                query = query.order('id').range(offset, offset + limit - 1)
+            result = self._execute(query)
             # Parse attachments JSON for each task
-            for task in tasks:
-                if 'attachments' in task and isinstance(task['attachments'], str):
-                    try:
-                        task['attachments'] = json.loads(task['attachments'])
-                    except:
-                        task['attachments'] = []
-            return tasks
+            return _decode_json_field(result.data or [], 'attachments')
         except Exception as e:
             print(f"[ERROR] Error fetching tasks: {e}")
             return []
     
     def create_task(self, task_data: Dict) -> Dict:
-        print(f"[SUPABASE] create_task called, enabled={self.enabled}")
+        log.debug("create_task called, enabled=%s", self.enabled)
         if not self.enabled:
             return task_data
         try:
-            # Convert attachments list to JSON string
-            if 'attachments' in task_data and isinstance(task_data['attachments'], list):
-                task_data['attachments'] = json.dumps(task_data['attachments'])
-            print(f"[SUPABASE] Inserting task: {task_data.get('title', 'unknown')}")
-            result = self.client.table('tasks').insert(task_data).execute()
-            print(f"[SUPABASE] Task insert result: {result.data[0]['id'] if result.data else 'NO DATA'}")
+            log.debug("Inserting task: %s", task_data.get('title', 'unknown'))
+            result = self._execute(self.client.table('tasks').insert(task_data))
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("Task insert result: %s", result.data[0]['id'] if result.data else 'NO DATA')
             task = result.data[0] if result.data else task_data
-            if 'attachments' in task and isinstance(task['attachments'], str):
-                task['attachments'] = json.loads(task['attachments'])
-            return task
+            return _decode_json_field([task], 'attachments')[0]
         except Exception as e:
             print(f"[ERROR] Error creating task: {e}")
-            import traceback
-            traceback.print_exc()
+            log.exception("Task insert failed")
             return task_data
     
     def update_task(self, task_id: str, updates: Dict) -> Optional[Dict]:
         if not self.enabled:
             return None
         try:
-            if 'attachments' in updates and isinstance(updates['attachments'], list):
-                updates['attachments'] = json.dumps(updates['attachments'])
-            result = self.client.table('tasks').update(updates).eq('id', task_id).execute()
-            task = result.data[0] if result.data else None
-            if task and 'attachments' in task and isinstance(task['attachments'], str):
-                task['attachments'] = json.loads(task['attachments'])
-            return task
+            result = self._execute(self.client.table('tasks').update(updates).eq('id', task_id))
+            return _decode_json_field(result.data[:1], 'attachments')[0] if result.data else None
         except Exception as e:
             print(f"[ERROR] Error updating task: {e}")
             return None
     
     def batch_create_tasks(self, tasks: List[Dict]) -> List[Dict]:
-        """Batch insert multiple tasks in a single API call - much faster!"""
+        """
+        Batch insert multiple tasks in a single API call - much faster!
+        Rows carry client-generated ids, so the insert skips echoing them back
+        (returning=minimal) and the caller's task dicts are returned unchanged.
+        """
         if not self.enabled or not tasks:
             return tasks
         try:
-            # Convert attachments to JSON strings
-            for task in tasks:
-                if 'attachments' in task and isinstance(task['attachments'], list):
-                    task['attachments'] = json.dumps(task['attachments'])
-            
-            print(f"[SUPABASE] Batch inserting {len(tasks)} tasks in ONE call...")
-            result = self.client.table('tasks').insert(tasks).execute()
-            print(f"[SUPABASE] Batch insert complete: {len(result.data) if result.data else 0} tasks created")
-            
-            # Parse attachments back for each task
-            returned_tasks = result.data or tasks
-            for task in returned_tasks:
-                if 'attachments' in task and isinstance(task['attachments'], str):
-                    try:
-                        task['attachments'] = json.loads(task['attachments'])
-                    except:
-                        task['attachments'] = []
-            return returned_tasks
+            log.debug("Batch inserting %d tasks in ONE call...", len(tasks))
+            self._execute(self.client.table('tasks').insert(tasks, returning=ReturnMethod.minimal))
+            log.debug("Batch insert complete: %d tasks created", len(tasks))
+            return tasks
         except Exception as e:
             print(f"[ERROR] Batch task insert failed: {e}")
             return tasks
     
+    def batch_upsert(self, table: str, rows: List[Dict], on_conflict: str = "id",
+                     ignore_duplicates: bool = False) -> List[Dict]:
+        """
+        Insert-or-update many rows of one table in a single API call (one statement, one commit).
+        Rows are matched on on_conflict and returned unchanged (returning=minimal). This merges:
+        rows missing from the list are left alone. With ignore_duplicates, rows that already exist
+        are skipped instead of overwritten. Keys a row lacks take the column default. Raises if the
+        write fails.
+        """
+        if table not in UPSERT_TABLES:
+            raise ValueError(f"batch_upsert: unsupported table '{table}'")
+        if not self.enabled or not rows:
+            return rows
+        self._execute(self.client.table(table).upsert(
+            rows, on_conflict=on_conflict, ignore_duplicates=ignore_duplicates,
+            default_to_null=False, returning=ReturnMethod.minimal))
+        self._invalidate(table)
+        log.debug("Batch upsert complete: %d rows into %s", len(rows), table)
+        return rows
+    
     def delete_task(self, task_id: str) -> bool:
         if not self.enabled:
             return False
         try:
-            self.client.table('tasks').delete().eq('id', task_id).execute()
+            self._execute(self.client.table('tasks').delete().eq('id', task_id))
             return True
         except Exception as e:
             print(f"[ERROR] Error deleting task: {e}")
@@ -211,19 +403,15 @@ class SupabaseService:
     def get_schedules(self) -> List[Dict]:
         if not self.enabled:
             return []
-        try:
-            result = self.client.table('schedules').select("*").execute()
-            return result.data or []
-        except Exception as e:
-            print(f"[ERROR] Error fetching schedules: {e}")
-            return []
+        return self._cached_select('schedules', 'schedules')
     
     def save_schedule(self, schedule_data: Dict) -> Dict:
         if not self.enabled:
             return schedule_data
         try:
-            result = self.client.table('schedules').insert(schedule_data).execute()
-            return result.data[0] if result.data else schedule_data
+            self._execute(self.client.table('schedules').insert(schedule_data, returning=ReturnMethod.minimal))
+            self._invalidate('schedules')
+            return schedule_data
         except Exception as e:
             print(f"[ERROR] Error creating schedule: {e}")
             return schedule_data
@@ -232,7 +420,8 @@ class SupabaseService:
         if not self.enabled:
             return False
         try:
-            self.client.table('schedules').delete().eq('id', schedule_id).execute()
+            self._execute(self.client.table('schedules').delete().eq('id', schedule_id))
+            self._invalidate('schedules')
             return True
         except Exception as e:
             print(f"[ERROR] Error deleting schedule: {e}")
@@ -240,19 +429,15 @@ class SupabaseService:
     
     # ==================== COMMENTS ====================
     
-    def get_comments(self) -> List[Dict]:
+    def get_comments(self, columns: str = "*", limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
         if not self.enabled:
             return []
         try:
-            result = self.client.table('comments').select("*").order('created_at', desc=True).execute()
-            comments = result.data or []
-            for comment in comments:
-                if 'replies' in comment and isinstance(comment['replies'], str):
-                    try:
-                        comment['replies'] = json.loads(comment['replies'])
-                    except:
-                        comment['replies'] = []
-            return comments
+            query = self.client.table('comments').select(columns).order('created_at', desc=True)
+            if limit is not None:
+                query = query.range(offset, offset + limit - 1)
+            result = self._execute(query)
+            return _decode_json_field(result.data or [], 'replies')
         except Exception as e:
             print(f"[ERROR] Error fetching comments: {e}")
             return []
@@ -261,10 +446,8 @@ class SupabaseService:
         if not self.enabled:
             return comment_data
         try:
-            if 'replies' in comment_data and isinstance(comment_data['replies'], list):
-                comment_data['replies'] = json.dumps(comment_data['replies'])
-            result = self.client.table('comments').insert(comment_data).execute()
-            return result.data[0] if result.data else comment_data
+            self._execute(self.client.table('comments').insert(comment_data, returning=ReturnMethod.minimal))
+            return comment_data
         except Exception as e:
             print(f"[ERROR] Error creating comment: {e}")
             return comment_data
@@ -273,23 +456,65 @@ class SupabaseService:
         if not self.enabled:
             return None
         try:
-            if 'replies' in updates and isinstance(updates['replies'], list):
-                updates['replies'] = json.dumps(updates['replies'])
-            result = self.client.table('comments').update(updates).eq('id', comment_id).execute()
+            result = self._execute(self.client.table('comments').update(updates).eq('id', comment_id))
             return result.data[0] if result.data else None
         except Exception as e:
             print(f"[ERROR] Error updating comment: {e}")
             return None
     
+    def upload_comment_attachment(self, owner_id: str, filename: Optional[str], data_url: Optional[str]) -> Optional[str]:
+        """Move a base64 data URL into Supabase Storage; returns the public URL or None to keep it inline"""
+        if not self.enabled or not data_url or not data_url.startswith('data:'):
+            return None
+        try:
+            header, encoded = data_url.split(',', 1)
+            content_type = header[5:].split(';')[0] or 'application/octet-stream'
+            raw_bytes = base64.b64decode(encoded)
+        except (ValueError, binascii.Error) as e:
+            print(f"[WARN] Invalid attachment data URL for {owner_id}: {e}")
+            return None
+        safe_name = "".join(x for x in (filename or 'attachment') if (x.isalnum() or x in "._-")) or 'attachment'
+        path = f"{owner_id}/{safe_name}"
+        try:
+            bucket = self.client.storage.from_(COMMENT_ATTACHMENT_BUCKET)
+            bucket.upload(path, raw_bytes, {"content-type": content_type, "upsert": "true"})
+            return bucket.get_public_url(path)
+        except Exception as e:
+            print(f"[ERROR] Error uploading comment attachment {path}: {e}")
+            return None
+    
+    def _list_storage_paths(self, bucket, prefix: str) -> List[str]:
+        """Object paths under prefix, descending into sub-folders (list() is one level only)"""
+        paths = []
+        for entry in bucket.list(prefix, {"limit": 1000}):
+            path = f"{prefix}/{entry['name']}"
+            if entry.get('id') is None:  # folder placeholder, e.g. a reply's {comment_id}/{reply_id}/
+                paths.extend(self._list_storage_paths(bucket, path))
+            else:
+                paths.append(path)
+        return paths
+
+    def delete_comment_attachments(self, comment_id: str):
+        """Remove the comment's and its replies' images from the public bucket"""
+        try:
+            bucket = self.client.storage.from_(COMMENT_ATTACHMENT_BUCKET)
+            paths = self._list_storage_paths(bucket, comment_id)
+            if paths:
+                bucket.remove(paths)
+                print(f"[INFO] Removed {len(paths)} attachment(s) of comment {comment_id}")
+        except Exception as e:
+            print(f"[WARN] Could not remove attachments of comment {comment_id}: {e}")
+
     def delete_comment(self, comment_id: str) -> bool:
         if not self.enabled:
             return False
         try:
-            self.client.table('comments').delete().eq('id', comment_id).execute()
-            return True
+            self._execute(self.client.table('comments').delete().eq('id', comment_id))
         except Exception as e:
             print(f"[ERROR] Error deleting comment: {e}")
             return False
+        self.delete_comment_attachments(comment_id)
+        return True
     
     # ==================== CSMS PB ====================
     
@@ -297,15 +522,8 @@ class SupabaseService:
         if not self.enabled:
             return []
         try:
-            result = self.client.table('csms_pb').select("*").execute()
-            records = result.data or []
-            for record in records:
-                if 'attachments' in record and isinstance(record['attachments'], str):
-                    try:
-                        record['attachments'] = json.loads(record['attachments'])
-                    except:
-                        record['attachments'] = []
-            return records
+            result = self._execute(self.client.table('csms_pb').select("*"))
+            return _decode_json_field(result.data or [], 'attachments')
         except Exception as e:
             print(f"[ERROR] Error fetching CSMS PB: {e}")
             return []
@@ -314,10 +532,8 @@ class SupabaseService:
         if not self.enabled:
             return pb_data
         try:
-            if 'attachments' in pb_data and isinstance(pb_data['attachments'], list):
-                pb_data['attachments'] = json.dumps(pb_data['attachments'])
-            result = self.client.table('csms_pb').insert(pb_data).execute()
-            return result.data[0] if result.data else pb_data
+            self._execute(self.client.table('csms_pb').insert(pb_data, returning=ReturnMethod.minimal))
+            return pb_data
         except Exception as e:
             print(f"[ERROR] Error creating CSMS PB: {e}")
             return pb_data
@@ -326,7 +542,7 @@ class SupabaseService:
         if not self.enabled:
             return None
         try:
-            result = self.client.table('csms_pb').update(updates).eq('id', pb_id).execute()
+            result = self._execute(self.client.table('csms_pb').update(updates).eq('id', pb_id))
             return result.data[0] if result.data else None
         except Exception as e:
             print(f"[ERROR] Error updating CSMS PB: {e}")
@@ -336,7 +552,7 @@ class SupabaseService:
         if not self.enabled:
             return False
         try:
-            self.client.table('csms_pb').delete().eq('id', pb_id).execute()
+            self._execute(self.client.table('csms_pb').delete().eq('id', pb_id))
             return True
         except Exception as e:
             print(f"[ERROR] Error deleting CSMS PB: {e}")
@@ -347,19 +563,15 @@ class SupabaseService:
     def get_related_docs(self) -> List[Dict]:
         if not self.enabled:
             return []
-        try:
-            result = self.client.table('related_docs').select("*").execute()
-            return result.data or []
-        except Exception as e:
-            print(f"[ERROR] Error fetching related docs: {e}")
-            return []
+        return self._cached_select('related_docs', 'related docs')
     
     def save_related_doc(self, doc_data: Dict) -> Dict:
         if not self.enabled:
             return doc_data
         try:
-            result = self.client.table('related_docs').insert(doc_data).execute()
-            return result.data[0] if result.data else doc_data
+            self._execute(self.client.table('related_docs').insert(doc_data, returning=ReturnMethod.minimal))
+            self._invalidate('related_docs')
+            return doc_data
         except Exception as e:
             print(f"[ERROR] Error creating related doc: {e}")
             return doc_data
@@ -368,7 +580,8 @@ class SupabaseService:
         if not self.enabled:
             return False
         try:
-            self.client.table('related_docs').delete().eq('id', doc_id).execute()
+            self._execute(self.client.table('related_docs').delete().eq('id', doc_id))
+            self._invalidate('related_docs')
             return True
         except Exception as e:
             print(f"[ERROR] Error deleting related doc: {e}")
@@ -377,22 +590,73 @@ class SupabaseService:
     # ==================== LOGGING ====================
 
     def log_event(self, level: str, service: str, message: str, details: str = None) -> bool:
-        """Log an event to the app_logs table"""
+        """Write an event to app_logs (queued for the batch flusher when LOG_BATCHING is on)"""
         if not self.enabled:
             return False
+        log_data = {
+            "level": level,
+            "service": service,
+            "message": message,
+            "details": details,
+            "created_at": datetime.now(timezone.utc).isoformat(timespec='milliseconds')
+        }
+        if not LOG_BATCHING:
+            try:
+                self._execute(self.client.table('app_logs').insert(log_data, returning=ReturnMethod.minimal))
+                return True
+            except Exception as e:
+                print(f"[ERROR] Failed to write log to Supabase: {e}")
+                return False
+        self._ensure_log_flusher()
         try:
-            log_data = {
-                "level": level,
-                "service": service,
-                "message": message,
-                "details": details,
-                "created_at": datetime.now().isoformat()
-            }
-            self.client.table('app_logs').insert(log_data).execute()
+            self._log_queue.put_nowait(log_data)
             return True
-        except Exception as e:
-            print(f"[ERROR] Failed to write log to Supabase: {e}")
+        except queue.Full:
+            # Never block the caller on logging; count what was shed instead
+            self.dropped_log_events += 1
             return False
 
+    def _ensure_log_flusher(self):
+        if self._log_flusher_thread is not None:
+            return
+        with self._log_flusher_lock:
+            if self._log_flusher_thread is None:
+                self._log_flusher_thread = threading.Thread(target=self._log_flusher, name="app-log-flusher", daemon=True)
+                self._log_flusher_thread.start()
+                atexit.register(self.flush_logs)
+
+    def _drain_logs(self, timeout: float) -> List[Dict]:
+        """Block up to timeout for the first queued row, then take up to LOG_BATCH_SIZE without waiting"""
+        try:
+            batch = [self._log_queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(batch) < LOG_BATCH_SIZE:
+            try:
+                batch.append(self._log_queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _insert_logs(self, batch: List[Dict]):
+        try:
+            self._execute(self.client.table('app_logs').insert(batch, returning=ReturnMethod.minimal))
+        except Exception as e:
+            print(f"[ERROR] Failed to write {len(batch)} log(s) to Supabase: {e}")
+
+    def _log_flusher(self):
+        while True:
+            batch = self._drain_logs(LOG_FLUSH_INTERVAL)
+            if batch:
+                self._insert_logs(batch)
+
+    def flush_logs(self):
+        """Insert whatever is still queued (called at interpreter exit)"""
+        while True:
+            batch = self._drain_logs(0)
+            if not batch:
+                return
+            self._insert_logs(batch)
+
 # Global instance
 supabase_service = SupabaseService()